@@ -0,0 +1,148 @@
+import json
+from typing import Iterator, Optional
+
+try:
+    import pyarrow as pa
+    import pyarrow.parquet as pq
+except ImportError:  # Parquet output is optional, JSONL works with the standard library
+    pa = None
+    pq = None
+
+
+def iter_file_lines(client, file_id: str) -> Iterator[str]:
+    """
+    Stream a batch output or error file line by line without loading it into memory
+
+    @param client: AzureOpenAI client
+    @param file_id: output_file_id or error_file_id of a batch
+    @return: Iterator of non-empty JSON lines
+    """
+    with client.files.with_streaming_response.content(file_id) as response:
+        for line in response.iter_lines():
+            if line.strip():
+                yield line
+
+
+def parse_record(line: str) -> dict:
+    """
+    Reduce one batch output / error line to a compact record
+
+    @param line: Raw JSON line from the batch output or error file
+    @return: Dict with custom_id, status, content, usage and error
+    """
+    raw = json.loads(line)
+    response = raw.get("response") or {}
+    body = response.get("body") or {}
+    choices = body.get("choices") or []
+    error = raw.get("error") or body.get("error")
+    return {
+        "custom_id": raw.get("custom_id"),
+        "status": response.get("status_code"),
+        "content": choices[0].get("message", {}).get("content") if choices else None,
+        "usage": body.get("usage"),
+        "error": json.dumps(error) if error else None,
+    }
+
+
+def succeeded(record: dict) -> bool:
+    return record["error"] is None and record["status"] == 200
+
+
+def iter_batch_records(client, batch) -> Iterator[dict]:
+    """
+    Stream the parsed records of a finished batch, successes first then errors
+
+    @param client: AzureOpenAI client
+    @param batch: Batch object returned by batches.retrieve
+    @return: Iterator of compact records
+    """
+    for file_id in (batch.output_file_id, batch.error_file_id):
+        if not file_id:
+            continue
+        for line in iter_file_lines(client, file_id):
+            yield parse_record(line)
+
+
+class JsonlWriter:
+    def __init__(self, path: str):
+        self.file = open(path, "w")
+
+    def write(self, record: dict):
+        self.file.write(json.dumps(record) + "\n")
+
+    def close(self):
+        self.file.close()
+
+
+class ParquetWriter:
+    # Records are buffered into row groups so memory stays bounded by batch_size
+    def __init__(self, path: str, batch_size: int = 10000):
+        if pq is None:
+            raise ImportError("pyarrow is required for Parquet output, pip install pyarrow")
+        self.schema = pa.schema([
+            ("custom_id", pa.string()),
+            ("status", pa.int32()),
+            ("content", pa.string()),
+            ("prompt_tokens", pa.int64()),
+            ("completion_tokens", pa.int64()),
+            ("total_tokens", pa.int64()),
+            ("error", pa.string()),
+        ])
+        self.writer = pq.ParquetWriter(path, self.schema)
+        self.batch_size = batch_size
+        self.rows = []
+
+    def write(self, record: dict):
+        usage = record.get("usage") or {}
+        self.rows.append({
+            "custom_id": record["custom_id"],
+            "status": record["status"],
+            "content": record["content"],
+            "prompt_tokens": usage.get("prompt_tokens"),
+            "completion_tokens": usage.get("completion_tokens"),
+            "total_tokens": usage.get("total_tokens"),
+            "error": record["error"],
+        })
+        if len(self.rows) >= self.batch_size:
+            self.flush()
+
+    def flush(self):
+        if self.rows:
+            self.writer.write_table(pa.Table.from_pylist(self.rows, schema=self.schema))
+            self.rows = []
+
+    def close(self):
+        self.flush()
+        self.writer.close()
+
+
+def open_writer(path: str):
+    return ParquetWriter(path) if path.endswith(".parquet") else JsonlWriter(path)
+
+
+def ingest_batch(client, output_file_id: Optional[str], error_file_id: Optional[str], path: str) -> dict:
+    """
+    Stream a finished batch's output and error files into one results file
+
+    @param client: AzureOpenAI client
+    @param output_file_id: Batch output_file_id, may be None
+    @param error_file_id: Batch error_file_id, may be None
+    @param path: Destination file, .parquet for Parquet and JSONL otherwise
+    @return: Counts of succeeded and failed records
+    """
+    counts = {"succeeded": 0, "failed": 0}
+    writer = open_writer(path)
+    try:
+        for file_id in (output_file_id, error_file_id):
+            if not file_id:
+                continue
+            for line in iter_file_lines(client, file_id):
+                record = parse_record(line)
+                writer.write(record)
+                if succeeded(record):
+                    counts["succeeded"] += 1
+                else:
+                    counts["failed"] += 1
+    finally:
+        writer.close()
+    return counts
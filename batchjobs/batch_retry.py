@@ -0,0 +1,104 @@
+import asyncio
+import json
+import os
+
+from batch_results import iter_batch_records, open_writer, succeeded
+from batch_submit import submit_shard
+from batch_tracker import BATCH_DONE, BatchTracker
+
+
+def read_custom_ids(path: str) -> set:
+    with open(path, "r", encoding="utf-8") as file:
+        return {json.loads(line)["custom_id"] for line in file if line.strip()}
+
+
+def build_retry_file(input_path: str, failed_ids: set, out_path: str) -> list:
+    """
+    Copy only the failed requests of the original input into a new batch file
+
+    @param input_path: Original JSONL batch input
+    @param failed_ids: custom_ids to resubmit
+    @param out_path: Retry input file to write
+    @return: custom_ids written, in input order
+    """
+    written = []
+    with open(input_path, "r", encoding="utf-8") as source, open(out_path, "w", encoding="utf-8") as out:
+        for line in source:
+            if not line.strip():
+                continue
+            custom_id = json.loads(line)["custom_id"]
+            if custom_id in failed_ids:
+                out.write(line if line.endswith("\n") else line + "\n")
+                written.append(custom_id)
+    return written
+
+
+async def retry_failures(client, input_path: str, batch_id: str, max_rounds: int = 3, out_dir: str = "retries", results_path: str = "final_results.jsonl", endpoint: str = "/chat/completions", completion_window: str = "24h") -> dict:
+    """
+    Resubmit only the failed requests of a finished batch until they succeed or rounds run out
+
+    Successes from every round are streamed into one results file, requests that still
+    fail after the last round are written with their final error. A batch that hasn't
+    finished raises a RuntimeError instead, its requests would otherwise run and be billed twice.
+
+    @param client: AzureOpenAI client
+    @param input_path: Original JSONL batch input the batch was created from
+    @param batch_id: Finished batch to recover
+    @param max_rounds: Maximum number of retry batches
+    @param out_dir: Directory for retry input files and tracker state
+    @param results_path: Final merged results, .parquet for Parquet and JSONL otherwise
+    @param endpoint: Batch endpoint
+    @param completion_window: Batch completion window
+    @return: Counts of succeeded and failed requests and the rounds used
+    """
+    os.makedirs(out_dir, exist_ok=True)
+    tracker = BatchTracker(client, state_path=os.path.join(out_dir, "retry_state.json"))
+    expected = read_custom_ids(input_path)
+    counts = {"succeeded": 0, "failed": 0, "rounds": 0}
+    failed = {}
+    writer = open_writer(results_path)
+    try:
+        for round_number in range(max_rounds + 1):
+            batch = await asyncio.to_thread(client.batches.retrieve, batch_id)
+            if batch.status not in BATCH_DONE:
+                # An unfinished batch has no results yet, every request would look missing
+                raise RuntimeError(
+                    f"Batch {batch_id} is {batch.status}, retry its failures from {input_path} once it has finished"
+                )
+            failed = {}
+            seen = set()
+            for record in iter_batch_records(client, batch):
+                seen.add(record["custom_id"])
+                if succeeded(record):
+                    writer.write(record)
+                    counts["succeeded"] += 1
+                else:
+                    failed[record["custom_id"]] = record
+            # Requests missing from both files (e.g. an expired or failed batch) need a retry too
+            for custom_id in expected - seen:
+                failed[custom_id] = {"custom_id": custom_id, "status": None, "content": None, "usage": None, "error": f"missing from batch {batch_id} ({batch.status})"}
+
+            print(f"Round {round_number}: batch {batch_id} left {len(failed)} failed requests")
+            if not failed or round_number == max_rounds:
+                break
+
+            retry_path = os.path.join(out_dir, f"retry.{round_number + 1}.jsonl")
+            retry_ids = build_retry_file(input_path, set(failed), retry_path)
+            shard = await asyncio.to_thread(
+                submit_shard, client, {"path": retry_path, "custom_ids": retry_ids}, endpoint, completion_window
+            )
+            tracker.track_batch(shard["batch_id"])
+            # If the tracker gives up polling, the status check of the next round stops before resubmitting
+            await tracker.run()
+            batch_id = shard["batch_id"]
+            # Later rounds are recovered from the retry file the batch was created from
+            input_path = retry_path
+            expected = set(retry_ids)
+            counts["rounds"] += 1
+
+        for record in failed.values():
+            writer.write(record)
+        counts["failed"] = len(failed)
+    finally:
+        writer.close()
+    return counts
@@ -0,0 +1,185 @@
+import json
+import os
+from concurrent.futures import ThreadPoolExecutor, as_completed
+
+from batch_results import iter_batch_records, open_writer, succeeded
+
+# Azure OpenAI global batch limits per input file
+MAX_REQUESTS_PER_FILE = 100000
+MAX_BYTES_PER_FILE = 200 * 1024 * 1024
+
+
+def validate_requests(path: str, endpoint: str = "/chat/completions") -> int:
+    """
+    Check every line of a batch input file before anything is uploaded
+
+    @param path: JSONL batch input file
+    @param endpoint: Endpoint every request must target
+    @return: Number of requests in the file
+    """
+    seen = set()
+    errors = []
+    count = 0
+    with open(path, "r", encoding="utf-8") as file:
+        for number, line in enumerate(file, start=1):
+            if not line.strip():
+                continue
+            count += 1
+            try:
+                request = json.loads(line)
+            except ValueError as e:
+                errors.append(f"line {number}: invalid JSON ({e})")
+                continue
+            custom_id = request.get("custom_id")
+            if not custom_id:
+                errors.append(f"line {number}: missing custom_id")
+            elif custom_id in seen:
+                errors.append(f"line {number}: duplicate custom_id {custom_id!r}")
+            else:
+                seen.add(custom_id)
+            if request.get("method") != "POST":
+                errors.append(f"line {number}: method must be POST")
+            if request.get("url") != endpoint:
+                errors.append(f"line {number}: url must be {endpoint}")
+            if not isinstance(request.get("body"), dict):
+                errors.append(f"line {number}: missing request body")
+    if errors:
+        raise ValueError(f"{len(errors)} invalid requests in {path}:\n" + "\n".join(errors[:50]))
+    return count
+
+
+def shard_file(path: str, out_dir: str, max_requests: int = MAX_REQUESTS_PER_FILE, max_bytes: int = MAX_BYTES_PER_FILE) -> list:
+    """
+    Split a batch input file into shards under the per-file request and byte limits
+
+    @param path: JSONL batch input file
+    @param out_dir: Directory the shard files are written to
+    @param max_requests: Maximum requests per shard
+    @param max_bytes: Maximum bytes per shard
+    @return: List of shards, each a dict with its path and custom_ids in input order
+    """
+    os.makedirs(out_dir, exist_ok=True)
+    base = os.path.splitext(os.path.basename(path))[0]
+    shards = []
+    out = None
+    shard_bytes = 0
+
+    with open(path, "rb") as file:
+        for line in file:
+            if not line.strip():
+                continue
+            if not line.endswith(b"\n"):
+                line += b"\n"
+            if len(line) > max_bytes:
+                raise ValueError(f"Request {json.loads(line)['custom_id']} is larger than {max_bytes} bytes")
+            if out is None or len(shards[-1]["custom_ids"]) >= max_requests or shard_bytes + len(line) > max_bytes:
+                if out is not None:
+                    out.close()
+                shard_path = os.path.join(out_dir, f"{base}.{len(shards):04d}.jsonl")
+                out = open(shard_path, "wb")
+                shard_bytes = 0
+                shards.append({"path": shard_path, "custom_ids": []})
+            out.write(line)
+            shard_bytes += len(line)
+            shards[-1]["custom_ids"].append(json.loads(line)["custom_id"])
+    if out is not None:
+        out.close()
+    return shards
+
+
+def submit_shard(client, shard: dict, endpoint: str, completion_window: str) -> dict:
+    with open(shard["path"], "rb") as file:
+        uploaded = client.files.create(file=file, purpose="batch")
+    client.files.wait_for_processing(uploaded.id)
+    batch = client.batches.create(
+        input_file_id=uploaded.id,
+        endpoint=endpoint,
+        completion_window=completion_window,
+    )
+    shard["file_id"] = uploaded.id
+    shard["batch_id"] = batch.id
+    print(f"Submitted {shard['path']} as batch {batch.id} ({len(shard['custom_ids'])} requests)")
+    return shard
+
+
+def submit_sharded(client, path: str, out_dir: str = "shards", concurrency: int = 4, endpoint: str = "/chat/completions", completion_window: str = "24h", manifest_path: str = None) -> list:
+    """
+    Validate, shard, upload and submit a batch input file as parallel batch jobs
+
+    If any shard fails to submit the others still run, the manifest records their batch
+    IDs and the failed shards' errors, then a RuntimeError is raised.
+
+    @param client: AzureOpenAI client
+    @param path: JSONL batch input file
+    @param out_dir: Directory for shard files
+    @param concurrency: Shards uploaded and submitted at once
+    @param endpoint: Batch endpoint
+    @param completion_window: Batch completion window
+    @param manifest_path: Where to save the shard manifest, defaults to <out_dir>/manifest.json
+    @return: Shard manifest with file_id and batch_id for every shard
+    """
+    validate_requests(path, endpoint)
+    shards = shard_file(path, out_dir)
+    manifest_path = manifest_path or os.path.join(out_dir, "manifest.json")
+    failed = []
+    # The manifest is rewritten as each shard is submitted, so the batch IDs of shards that are
+    # already running (and billing) are on disk even if another shard fails or the run is interrupted
+    with ThreadPoolExecutor(max_workers=concurrency) as executor:
+        futures = {executor.submit(submit_shard, client, shard, endpoint, completion_window): shard for shard in shards}
+        for future in as_completed(futures):
+            shard = futures[future]
+            try:
+                future.result()
+            except Exception as e:
+                shard["error"] = str(e)
+                failed.append(shard)
+                print(f"Failed to submit {shard['path']}: {e}")
+            write_manifest(shards, manifest_path)
+    if failed:
+        raise RuntimeError(
+            f"{len(failed)} of {len(shards)} shards failed to submit, submitted batches are in {manifest_path}: {failed[0]['error']}"
+        )
+    return shards
+
+
+def write_manifest(shards: list, path: str):
+    # Written to a temporary file first so an interrupted write never leaves a truncated manifest
+    with open(path + ".tmp", "w") as file:
+        json.dump(shards, file)
+    os.replace(path + ".tmp", path)
+
+
+def merge_outputs(client, shards: list, path: str) -> dict:
+    """
+    Merge the results of every shard's batch into one file in input custom_id order
+
+    Shards are contiguous slices of the input, so each shard is ordered on its own
+    and written out in turn, only one shard's records are held in memory.
+
+    @param client: AzureOpenAI client
+    @param shards: Shard manifest returned by submit_sharded
+    @param path: Destination file, .parquet for Parquet and JSONL otherwise
+    @return: Counts of succeeded, failed and missing records
+    """
+    counts = {"succeeded": 0, "failed": 0, "missing": 0}
+    writer = open_writer(path)
+    try:
+        for shard in shards:
+            records = {}
+            # A shard that failed to submit has no batch, all its rows are reported missing
+            if shard.get("batch_id"):
+                batch = client.batches.retrieve(shard["batch_id"])
+                records = {record["custom_id"]: record for record in iter_batch_records(client, batch)}
+            for custom_id in shard["custom_ids"]:
+                record = records.get(custom_id)
+                if record is None:
+                    counts["missing"] += 1
+                    record = {"custom_id": custom_id, "status": None, "content": None, "usage": None, "error": "missing from batch output"}
+                elif succeeded(record):
+                    counts["succeeded"] += 1
+                else:
+                    counts["failed"] += 1
+                writer.write(record)
+    finally:
+        writer.close()
+    return counts
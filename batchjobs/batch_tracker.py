@@ -0,0 +1,134 @@
+import asyncio
+import datetime
+import json
+import os
+from typing import Callable, Optional
+
+from batch_results import ingest_batch
+
+FILE_DONE = ("processed", "error", "deleted")
+BATCH_DONE = ("completed", "failed", "canceled", "cancelled", "expired")
+
+
+class BatchTracker:
+    """
+    Track many uploaded files and batch jobs at once
+
+    Each job is polled on its own schedule, starting fast and backing off while its
+    status doesn't change. Job state is saved to a JSON file after every change so a
+    restarted process picks up where it left off. Callbacks fire and outputs are
+    downloaded as soon as each job reaches a terminal status.
+    """
+
+    def __init__(self, client, state_path: str = "batch_state.json", min_interval: float = 5, max_interval: float = 300, factor: float = 1.5, max_errors: int = 10):
+        """
+        @param client: AzureOpenAI client, calls run on worker threads
+        @param state_path: JSON file used to persist tracked jobs
+        @param min_interval: First poll delay in seconds
+        @param max_interval: Longest delay between polls in seconds
+        @param factor: Multiplier applied to the delay after each unchanged poll
+        @param max_errors: Failed polls in a row before a job is given up on for this run
+        """
+        self.client = client
+        self.state_path = state_path
+        self.min_interval = min_interval
+        self.max_interval = max_interval
+        self.factor = factor
+        self.max_errors = max_errors
+        self.callbacks = {}
+        self.jobs = {}
+        if os.path.exists(state_path):
+            with open(state_path) as file:
+                self.jobs = json.load(file)
+
+    def save(self):
+        temp_path = self.state_path + ".tmp"
+        with open(temp_path, "w") as file:
+            json.dump(self.jobs, file, indent=2)
+        os.replace(temp_path, self.state_path)
+
+    def track_file(self, file_id: str, on_done: Optional[Callable] = None):
+        self.jobs.setdefault(file_id, {"kind": "file", "status": None})
+        if on_done:
+            self.callbacks[file_id] = on_done
+        self.save()
+
+    def track_batch(self, batch_id: str, on_done: Optional[Callable] = None, download_to: Optional[str] = None):
+        """
+        @param batch_id: Batch to track
+        @param on_done: Called with the final batch object
+        @param download_to: Stream the batch output and error files here once it finishes
+        """
+        job = self.jobs.setdefault(batch_id, {"kind": "batch", "status": None})
+        if download_to:
+            job["download_to"] = download_to
+        if on_done:
+            self.callbacks[batch_id] = on_done
+        self.save()
+
+    def pending(self) -> list:
+        return [job_id for job_id, job in self.jobs.items() if not job.get("done")]
+
+    async def poll(self, job_id: str):
+        job = self.jobs[job_id]
+        interval = self.min_interval
+        errors = 0
+        while True:
+            try:
+                if job["kind"] == "file":
+                    result = await asyncio.to_thread(self.client.files.retrieve, job_id)
+                    done = result.status in FILE_DONE
+                else:
+                    result = await asyncio.to_thread(self.client.batches.retrieve, job_id)
+                    done = result.status in BATCH_DONE
+            except Exception as e:
+                # Timeouts and 5xx only affect this job, back off as if the status hadn't changed
+                errors += 1
+                print(f"{datetime.datetime.now()} {job['kind'].title()} Id: {job_id}, poll failed ({errors}/{self.max_errors}): {e}")
+                if errors >= self.max_errors:
+                    # Left unfinished in the state file, the next run picks it up again
+                    job["error"] = str(e)
+                    self.save()
+                    return None
+                interval = min(self.max_interval, interval * self.factor)
+                await asyncio.sleep(interval)
+                continue
+            errors = 0
+            job.pop("error", None)
+
+            if result.status != job["status"]:
+                print(f"{datetime.datetime.now()} {job['kind'].title()} Id: {job_id}, Status: {result.status}")
+                job["status"] = result.status
+                interval = self.min_interval
+                self.save()
+            else:
+                interval = min(self.max_interval, interval * self.factor)
+
+            if done:
+                break
+            await asyncio.sleep(interval)
+
+        if job.get("download_to") and not job.get("downloaded"):
+            job["counts"] = await asyncio.to_thread(
+                ingest_batch, self.client, result.output_file_id, result.error_file_id, job["download_to"]
+            )
+            job["downloaded"] = True
+        job["done"] = True
+        self.save()
+
+        callback = self.callbacks.get(job_id)
+        if callback:
+            outcome = callback(result)
+            if asyncio.iscoroutine(outcome):
+                await outcome
+        return result
+
+    async def run(self) -> dict:
+        """
+        Poll every unfinished job until all of them reach a terminal status
+
+        @return: Mapping of job id to its final file / batch object, None for jobs that kept failing to poll
+        """
+        job_ids = self.pending()
+        results = await asyncio.gather(*(self.poll(job_id) for job_id in job_ids))
+        return dict(zip(job_ids, results))
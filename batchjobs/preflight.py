@@ -0,0 +1,250 @@
+import asyncio
+import base64
+import hashlib
+import io
+import json
+import os
+from typing import Optional
+
+import httpx
+
+try:
+    from PIL import Image
+except ImportError:  # Without Pillow images are only validated and inlined if already under budget
+    Image = None
+
+
+class ImagePreflight:
+    """
+    Check and optionally inline every image_url of a vision batch file before submission
+
+    URLs are fetched concurrently with a bounded number of connections. Successful checks
+    are cached on disk by URL and encoded images by content hash, so a URL or an identical
+    image seen again (in this file or a later one) isn't fetched or re-encoded twice.
+    """
+
+    def __init__(self, concurrency: int = 8, timeout: float = 20, max_download_bytes: int = 20 * 1024 * 1024, cache_dir: str = ".image_cache"):
+        """
+        @param concurrency: Maximum concurrent downloads
+        @param timeout: Per request timeout in seconds
+        @param max_download_bytes: Images larger than this are rejected (the service limit is 20 MB)
+        @param cache_dir: Directory for the URL and content hash cache
+        """
+        self.concurrency = concurrency
+        self.timeout = timeout
+        self.max_download_bytes = max_download_bytes
+        self.cache_dir = cache_dir
+        os.makedirs(cache_dir, exist_ok=True)
+
+    def _cache_path(self, kind: str, key: str) -> str:
+        return os.path.join(self.cache_dir, f"{hashlib.sha256(key.encode('utf-8')).hexdigest()}.{kind}")
+
+    def _read_cache(self, kind: str, key: str) -> Optional[str]:
+        path = self._cache_path(kind, key)
+        if os.path.exists(path):
+            with open(path) as file:
+                return file.read()
+        return None
+
+    def _write_cache(self, kind: str, key: str, value: str):
+        with open(self._cache_path(kind, key), "w") as file:
+            file.write(value)
+
+    async def fetch(self, client: httpx.AsyncClient, url: str) -> dict:
+        """
+        Download one image, stopping early if it isn't an image or is too large
+
+        @return: Dict with ok, error, content_type and the raw bytes when ok
+        """
+        try:
+            async with client.stream("GET", url) as response:
+                if response.status_code != 200:
+                    return {"ok": False, "error": f"HTTP {response.status_code}"}
+                content_type = response.headers.get("content-type", "").split(";")[0].strip()
+                if not content_type.startswith("image/"):
+                    return {"ok": False, "error": f"not an image ({content_type or 'no content-type'})"}
+                length = response.headers.get("content-length")
+                if length:
+                    try:
+                        length = int(length)
+                    except ValueError:
+                        return {"ok": False, "error": f"invalid content-length {length!r}"}
+                    if length > self.max_download_bytes:
+                        return {"ok": False, "error": f"{length} bytes is over the {self.max_download_bytes} byte limit"}
+                data = bytearray()
+                async for chunk in response.aiter_bytes():
+                    data.extend(chunk)
+                    if len(data) > self.max_download_bytes:
+                        return {"ok": False, "error": f"over the {self.max_download_bytes} byte limit"}
+                return {"ok": True, "error": None, "content_type": content_type, "data": bytes(data)}
+        # InvalidURL (e.g. "http://[::1") isn't an HTTPError, it would otherwise abort the whole gather
+        except (httpx.HTTPError, httpx.InvalidURL, httpx.StreamError) as e:
+            return {"ok": False, "error": f"{type(e).__name__}: {e}"}
+
+    def encode(self, data: bytes, content_type: str, max_dim: int, max_short_side: int, budget: int) -> str:
+        """
+        Downscale and re-encode an image into a data URI under the byte budget
+
+        Images are fit inside max_dim and max_short_side, the same resize the service
+        applies for high detail, so the billed image tokens don't go up.
+
+        @return: data URI
+        """
+        if Image is None:
+            if len(data) > budget:
+                raise ValueError(f"{len(data)} bytes is over the {budget} byte budget and Pillow isn't installed to shrink it")
+            return f"data:{content_type};base64,{base64.b64encode(data).decode('ascii')}"
+
+        image = Image.open(io.BytesIO(data))
+        image.thumbnail((max_dim, max_dim))
+        if min(image.size) > max_short_side:
+            scale = max_short_side / min(image.size)
+            image = image.resize((round(image.width * scale), round(image.height * scale)))
+        if image.mode not in ("RGB", "L"):
+            image = image.convert("RGB")
+
+        quality = 85
+        while True:
+            buffer = io.BytesIO()
+            image.save(buffer, format="JPEG", quality=quality, optimize=True)
+            encoded = base64.b64encode(buffer.getvalue()).decode("ascii")
+            if len(encoded) <= budget:
+                return f"data:image/jpeg;base64,{encoded}"
+            if quality > 45:
+                quality -= 10
+            elif min(image.size) > 64:
+                image = image.resize((image.width // 2, image.height // 2))
+            else:
+                raise ValueError(f"could not encode under the {budget} byte budget")
+
+    async def check_urls(self, urls: set, inline: bool, max_dim: int, max_short_side: int, budget: int) -> dict:
+        """
+        @return: Mapping of URL to {"ok", "error", "data_uri"}
+        """
+        results = {}
+        pending = []
+        for url in urls:
+            # Only successful checks are cached, failures may be transient and are retried
+            cached = self._read_cache("url", url)
+            if cached is not None:
+                result = json.loads(cached)
+                if not inline:
+                    results[url] = result
+                    continue
+                data_uri = self._read_cache("datauri", encode_key(result["content_hash"], max_dim, max_short_side, budget))
+                if data_uri is not None:
+                    result["data_uri"] = data_uri
+                    results[url] = result
+                    continue
+            pending.append(url)
+
+        semaphore = asyncio.Semaphore(self.concurrency)
+        async with httpx.AsyncClient(timeout=self.timeout, follow_redirects=True) as client:
+            checked = await asyncio.gather(
+                *(self.check(client, semaphore, url, inline, max_dim, max_short_side, budget) for url in pending)
+            )
+        results.update(zip(pending, checked))
+        return results
+
+    async def check(self, client: httpx.AsyncClient, semaphore: asyncio.Semaphore, url: str, inline: bool, max_dim: int, max_short_side: int, budget: int) -> dict:
+        # Encoding happens here so only `concurrency` raw images are held in memory at once
+        async with semaphore:
+            result = await self.fetch(client, url)
+            entry = {"ok": result["ok"], "error": result["error"]}
+            if not result["ok"]:
+                return entry
+            content_hash = hashlib.sha256(result["data"]).hexdigest()
+            entry["content_hash"] = content_hash
+            if inline:
+                key = encode_key(content_hash, max_dim, max_short_side, budget)
+                data_uri = self._read_cache("datauri", key)
+                if data_uri is None:
+                    try:
+                        data_uri = await asyncio.to_thread(
+                            self.encode, result["data"], result["content_type"], max_dim, max_short_side, budget
+                        )
+                    except Exception as e:
+                        return {"ok": False, "error": f"encode failed: {e}"}
+                    self._write_cache("datauri", key, data_uri)
+                entry["data_uri"] = data_uri
+            self._write_cache("url", url, json.dumps({k: v for k, v in entry.items() if k != "data_uri"}))
+            return entry
+
+    async def run(self, input_path: str, output_path: str, rejects_path: str, inline: bool = False, max_dim: int = 2048, max_short_side: int = 768, budget: int = 1024 * 1024) -> dict:
+        """
+        Write the requests whose images are reachable to output_path, the rest to rejects_path
+
+        @param input_path: JSONL batch input
+        @param output_path: Validated (and optionally inlined) batch input
+        @param rejects_path: Requests dropped, with the reason for each URL
+        @param inline: Replace image URLs with downscaled data URIs
+        @param max_dim: Longest side after downscaling
+        @param max_short_side: Shortest side after downscaling
+        @param budget: Maximum base64 bytes per inlined image
+        @return: Counts of kept and rejected requests and checked URLs
+        """
+        urls = set()
+        with open(input_path, "r", encoding="utf-8") as file:
+            for line in file:
+                if line.strip():
+                    urls.update(image_urls(json.loads(line)))
+
+        results = await self.check_urls(urls, inline, max_dim, max_short_side, budget)
+
+        counts = {"kept": 0, "rejected": 0, "urls": len(urls)}
+        with open(input_path, "r", encoding="utf-8") as file, \
+                open(output_path, "w", encoding="utf-8") as output, \
+                open(rejects_path, "w", encoding="utf-8") as rejects:
+            for line in file:
+                if not line.strip():
+                    continue
+                request = json.loads(line)
+                errors = {url: results[url]["error"] for url in image_urls(request) if not results[url]["ok"]}
+                if errors:
+                    rejects.write(json.dumps({"custom_id": request.get("custom_id"), "errors": errors}) + "\n")
+                    counts["rejected"] += 1
+                    continue
+                if inline:
+                    replace_image_urls(request, {url: results[url]["data_uri"] for url in image_urls(request)})
+                output.write(json.dumps(request, ensure_ascii=False) + "\n")
+                counts["kept"] += 1
+        return counts
+
+
+def encode_key(content_hash: str, max_dim: int, max_short_side: int, budget: int) -> str:
+    return f"{content_hash}:{max_dim}:{max_short_side}:{budget}"
+
+
+def _image_parts(request: dict):
+    for message in request.get("body", {}).get("messages", []):
+        content = message.get("content")
+        if isinstance(content, list):
+            for part in content:
+                if part.get("type") == "image_url":
+                    yield part["image_url"]
+
+
+def image_urls(request: dict) -> list:
+    return [part["url"] for part in _image_parts(request) if part["url"].startswith(("http://", "https://"))]
+
+
+def replace_image_urls(request: dict, replacements: dict):
+    for part in _image_parts(request):
+        if part["url"] in replacements:
+            part["url"] = replacements[part["url"]]
+
+
+if __name__ == "__main__":
+    import argparse
+
+    parser = argparse.ArgumentParser(description="Pre-flight check image URLs in a vision batch file")
+    parser.add_argument("input", help="JSONL batch input")
+    parser.add_argument("--output", default="images.checked.jsonl")
+    parser.add_argument("--rejects", default="images.rejected.jsonl")
+    parser.add_argument("--inline", action="store_true", help="Inline downscaled images as data URIs")
+    parser.add_argument("--budget", type=int, default=1024 * 1024, help="Maximum base64 bytes per inlined image")
+    parser.add_argument("--concurrency", type=int, default=8)
+    args = parser.parse_args()
+
+    preflight = ImagePreflight(concurrency=args.concurrency)
+    print(asyncio.run(preflight.run(args.input, args.output, args.rejects, inline=args.inline, budget=args.budget)))
@@ -0,0 +1,111 @@
+import asyncio
+import functools
+import json
+from contextlib import contextmanager
+from types import SimpleNamespace
+
+import pytest
+
+import batch_retry
+from batch_retry import retry_failures
+from batch_tracker import BatchTracker
+
+
+def success(custom_id: str) -> str:
+    body = {"choices": [{"message": {"content": "ok"}}], "usage": {"total_tokens": 1}}
+    return json.dumps({"custom_id": custom_id, "response": {"status_code": 200, "body": body}})
+
+
+def failure(custom_id: str) -> str:
+    return json.dumps({"custom_id": custom_id, "response": {"status_code": 500, "body": {"error": {"message": "server error"}}}})
+
+
+class FakeClient:
+    """
+    Just enough of the AzureOpenAI client for retry_failures, batches are listed as statuses per retrieve call
+    """
+
+    def __init__(self, batches: dict, files: dict):
+        """
+        @param batches: Mapping of batch id to a list of statuses (or exceptions) returned by successive retrieves
+        @param files: Mapping of file id to its JSON lines
+        """
+        self.statuses = batches
+        self.contents = files
+        self.created = []
+        self.batches = SimpleNamespace(retrieve=self.retrieve, create=self.create_batch)
+        self.files = SimpleNamespace(
+            create=self.create_file,
+            wait_for_processing=lambda file_id: None,
+            with_streaming_response=SimpleNamespace(content=self.content),
+        )
+
+    def retrieve(self, batch_id: str):
+        statuses = self.statuses[batch_id]
+        status = statuses.pop(0) if len(statuses) > 1 else statuses[0]
+        if isinstance(status, Exception):
+            raise status
+        return SimpleNamespace(
+            id=batch_id,
+            status=status,
+            output_file_id=f"{batch_id}-output" if f"{batch_id}-output" in self.contents else None,
+            error_file_id=f"{batch_id}-errors" if f"{batch_id}-errors" in self.contents else None,
+        )
+
+    def create_file(self, file, purpose: str):
+        self.created.append(file.read().decode("utf-8"))
+        return SimpleNamespace(id=f"file-{len(self.created)}")
+
+    def create_batch(self, input_file_id: str, endpoint: str, completion_window: str):
+        return SimpleNamespace(id=f"retry-{len(self.created)}")
+
+    @contextmanager
+    def content(self, file_id: str):
+        yield SimpleNamespace(iter_lines=lambda: iter(self.contents[file_id]))
+
+
+@pytest.fixture
+def input_path(tmp_path):
+    path = tmp_path / "input.jsonl"
+    path.write_text("".join(json.dumps({"custom_id": custom_id, "body": {}}) + "\n" for custom_id in ("r1", "r2")))
+    return str(path)
+
+
+@pytest.fixture(autouse=True)
+def fast_tracker(monkeypatch):
+    monkeypatch.setattr(batch_retry, "BatchTracker", functools.partial(BatchTracker, min_interval=0, max_errors=2))
+
+
+def run_retry(client, input_path: str, tmp_path, batch_id: str = "b1") -> dict:
+    return asyncio.run(retry_failures(
+        client, input_path, batch_id, out_dir=str(tmp_path / "retries"), results_path=str(tmp_path / "results.jsonl")
+    ))
+
+
+def test_failed_requests_are_resubmitted_until_they_succeed(tmp_path, input_path):
+    client = FakeClient(
+        {"b1": ["completed"], "retry-1": ["completed"]},
+        {"b1-output": [success("r1")], "b1-errors": [failure("r2")], "retry-1-output": [success("r2")]},
+    )
+    counts = run_retry(client, input_path, tmp_path)
+    assert counts == {"succeeded": 2, "failed": 0, "rounds": 1}
+    assert [json.loads(line)["custom_id"] for line in client.created[0].splitlines()] == ["r2"]
+
+
+def test_unfinished_batch_is_not_resubmitted(tmp_path, input_path):
+    client = FakeClient({"b1": ["in_progress"]}, {})
+    with pytest.raises(RuntimeError, match="in_progress"):
+        run_retry(client, input_path, tmp_path)
+    assert client.created == []
+
+
+def test_retry_batch_the_tracker_gave_up_on_is_not_resubmitted(tmp_path, input_path):
+    # The retry batch can't be polled by the tracker, then reports it is still running
+    client = FakeClient(
+        {"b1": ["completed"], "retry-1": [TimeoutError("poll timed out"), TimeoutError("poll timed out"), "in_progress"]},
+        {"b1-output": [success("r1")], "b1-errors": [failure("r2")]},
+    )
+    with pytest.raises(RuntimeError, match="retry-1 is in_progress"):
+        run_retry(client, input_path, tmp_path)
+    assert len(client.created) == 1
+    assert [json.loads(line)["custom_id"] for line in (tmp_path / "results.jsonl").read_text().splitlines()] == ["r1"]
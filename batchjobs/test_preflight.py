@@ -0,0 +1,162 @@
+import asyncio
+import base64
+import io
+import json
+import threading
+from collections import Counter
+from http.server import BaseHTTPRequestHandler, ThreadingHTTPServer
+
+import pytest
+
+from preflight import ImagePreflight
+
+MAX_DOWNLOAD_BYTES = 64 * 1024
+
+
+def png_bytes(width: int = 8, height: int = 8) -> bytes:
+    # A valid PNG is only needed for the inline tests, everything else just checks headers and sizes
+    Image = pytest.importorskip("PIL.Image")
+    image = Image.effect_noise((width, height), 64).convert("RGB")
+    buffer = io.BytesIO()
+    image.save(buffer, format="PNG")
+    return buffer.getvalue()
+
+
+class ImageServer:
+    """
+    Local HTTP server with fixed routes, counting the requests made to each path
+    """
+
+    def __init__(self, routes: dict):
+        """
+        @param routes: Mapping of path to (status, headers, body)
+        """
+        self.routes = routes
+        self.hits = Counter()
+        server = self
+
+        class Handler(BaseHTTPRequestHandler):
+            def do_GET(self):
+                server.hits[self.path] = server.hits[self.path] + 1
+                status, headers, body = server.routes.get(self.path, (404, {"Content-Type": "text/plain"}, b"not found"))
+                self.send_response(status)
+                for name, value in headers.items():
+                    self.send_header(name, value)
+                if "Content-Length" not in headers:
+                    self.send_header("Content-Length", str(len(body)))
+                self.end_headers()
+                self.wfile.write(body)
+
+            def log_message(self, format, *args):
+                pass
+
+        self.httpd = ThreadingHTTPServer(("127.0.0.1", 0), Handler)
+        self.httpd.daemon_threads = True
+        threading.Thread(target=self.httpd.serve_forever, daemon=True).start()
+
+    def url(self, path: str) -> str:
+        return f"http://127.0.0.1:{self.httpd.server_port}{path}"
+
+    def close(self):
+        self.httpd.shutdown()
+        self.httpd.server_close()
+
+
+@pytest.fixture
+def server():
+    server = ImageServer({})
+    yield server
+    server.close()
+
+
+def request_for(custom_id: str, *urls: str) -> dict:
+    content = [{"type": "text", "text": "What's in this image?"}]
+    content += [{"type": "image_url", "image_url": {"url": url}} for url in urls]
+    return {
+        "custom_id": custom_id,
+        "method": "POST",
+        "url": "/chat/completions",
+        "body": {"model": "gpt-4o", "messages": [{"role": "user", "content": content}]},
+    }
+
+
+def run_preflight(tmp_path, requests: list, max_download_bytes: int = MAX_DOWNLOAD_BYTES, **kwargs) -> tuple:
+    """
+    Run ImagePreflight.run over the requests with a cache in tmp_path
+
+    @return: (counts, kept requests by custom_id, rejected errors by custom_id)
+    """
+    input_path, output_path, rejects_path = tmp_path / "in.jsonl", tmp_path / "out.jsonl", tmp_path / "rejects.jsonl"
+    input_path.write_text("".join(json.dumps(request) + "\n" for request in requests))
+    preflight = ImagePreflight(concurrency=4, timeout=5, max_download_bytes=max_download_bytes, cache_dir=str(tmp_path / "cache"))
+    counts = asyncio.run(preflight.run(str(input_path), str(output_path), str(rejects_path), **kwargs))
+    kept = {request["custom_id"]: request for request in map(json.loads, output_path.read_text().splitlines())}
+    rejected = {reject["custom_id"]: reject["errors"] for reject in map(json.loads, rejects_path.read_text().splitlines())}
+    return counts, kept, rejected
+
+
+def test_rejects_missing_image(tmp_path, server):
+    counts, kept, rejected = run_preflight(tmp_path, [request_for("r1", server.url("/missing.png"))])
+    assert counts == {"kept": 0, "rejected": 1, "urls": 1}
+    assert rejected["r1"] == {server.url("/missing.png"): "HTTP 404"}
+
+
+def test_rejects_non_image(tmp_path, server):
+    server.routes["/page.png"] = (200, {"Content-Type": "text/html; charset=utf-8"}, b"<html></html>")
+    counts, kept, rejected = run_preflight(tmp_path, [request_for("r1", server.url("/page.png"))])
+    assert counts["rejected"] == 1
+    assert rejected["r1"][server.url("/page.png")] == "not an image (text/html)"
+
+
+def test_rejects_oversized_image(tmp_path, server):
+    server.routes["/big.png"] = (200, {"Content-Type": "image/png"}, b"\0" * (MAX_DOWNLOAD_BYTES + 1))
+    counts, kept, rejected = run_preflight(tmp_path, [request_for("r1", server.url("/big.png"))])
+    assert counts["rejected"] == 1
+    assert "byte limit" in rejected["r1"][server.url("/big.png")]
+
+
+def test_rejects_bad_url_and_content_length_without_aborting_the_run(tmp_path, server):
+    server.routes["/ok.png"] = (200, {"Content-Type": "image/png"}, b"\x89PNG")
+    server.routes["/bad-length.png"] = (200, {"Content-Type": "image/png", "Content-Length": "lots"}, b"\x89PNG")
+    requests = [
+        request_for("bad-url", "http://[::1"),
+        request_for("bad-length", server.url("/bad-length.png")),
+        request_for("ok", server.url("/ok.png")),
+    ]
+    counts, kept, rejected = run_preflight(tmp_path, requests)
+    assert counts == {"kept": 1, "rejected": 2, "urls": 3}
+    assert set(kept) == {"ok"}
+    assert set(rejected) == {"bad-url", "bad-length"}
+
+
+def test_inlines_images_under_the_budget(tmp_path, server):
+    budget = 40 * 1024
+    server.routes["/photo.png"] = (200, {"Content-Type": "image/png"}, png_bytes(1600, 1000))
+    server.routes["/icon.png"] = (200, {"Content-Type": "image/png"}, png_bytes(16, 16))
+    requests = [request_for("r1", server.url("/photo.png"), server.url("/icon.png"))]
+    # The noisy photo doesn't compress, it's several MB as a PNG
+    counts, kept, rejected = run_preflight(tmp_path, requests, max_download_bytes=20 * 1024 * 1024, inline=True, budget=budget)
+    assert counts == {"kept": 1, "rejected": 0, "urls": 2}
+
+    parts = kept["r1"]["body"]["messages"][0]["content"][1:]
+    for part in parts:
+        prefix, encoded = part["image_url"]["url"].split(",", 1)
+        assert prefix == "data:image/jpeg;base64"
+        assert len(encoded) <= budget
+        base64.b64decode(encoded, validate=True)
+
+
+def test_warm_cache_rerun_skips_downloads(tmp_path, server):
+    server.routes["/photo.png"] = (200, {"Content-Type": "image/png"}, png_bytes(64, 64))
+    requests = [
+        request_for("r1", server.url("/photo.png")),
+        request_for("r2", server.url("/photo.png"), server.url("/missing.png")),
+    ]
+    first = run_preflight(tmp_path, requests, inline=True)
+    second = run_preflight(tmp_path, requests, inline=True)
+
+    assert first == second
+    assert first[0] == {"kept": 1, "rejected": 1, "urls": 2}
+    # Successful checks and encodings come from the cache, failures may be transient and are fetched again
+    assert server.hits["/photo.png"] == 1
+    assert server.hits["/missing.png"] == 2
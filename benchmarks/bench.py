@@ -0,0 +1,355 @@
+import argparse
+import asyncio
+import importlib
+import json
+import os
+import subprocess
+import sys
+import time
+import tracemalloc
+
+from mock_server import MockConfig, serve
+
+REPO_ROOT = os.path.dirname(os.path.dirname(os.path.abspath(__file__)))
+QUERY = "What are the latest prompt injection defenses for LLM agents?"
+
+
+def mock_env(base_url):
+    # Point every SDK at the mock server, load_dotenv in the apps won't override these
+    os.environ.update({
+        "GROQ_API_KEY": "mock",
+        "GROQ_BASE_URL": base_url,
+        "EXA_API_KEY": "mock",
+        "EXA_BASE_URL": base_url,
+        "AZURE_ENDPOINT": base_url,
+        "AZURE_OPENAI_API_KEY": "mock",
+        "DEPLOYMENT_NAME": "model-router",
+        "API_VERSION": "2024-10-21",
+        "SEARCH_CACHE_PATH": "",
+        # Keep the rate limiters in the path but far above what the mock can serve
+        "RATE_LIMIT_GROQ_RPM": "1000000",
+        "RATE_LIMIT_GROQ_TPM": "1000000000",
+        "RATE_LIMIT_EXA_RPM": "1000000",
+        "RATE_LIMIT_AZURE_RPM": "1000000",
+        "RATE_LIMIT_AZURE_TPM": "1000000000",
+    })
+
+
+def import_app(folder, module):
+    """
+    Import an app module from its folder, the folders aren't packages
+
+    @param folder: Folder under the repo root, e.g. modelrouter
+    @param module: Module name inside it, e.g. main
+    @return: Imported module
+    """
+    sys.path.insert(0, os.path.join(REPO_ROOT, folder))
+    return importlib.import_module(module)
+
+
+# Each scenario returns an async op(session, iteration) -> dict of extra timings (may be empty)
+def scenario_router(args):
+    main = import_app("modelrouter", "main")
+    agent = main.AsyncModelRouterAgent("You are a CSPM triage assistant.")
+
+    async def op(session, iteration):
+        await agent.run(QUERY)
+        return {}
+    return op
+
+
+def scenario_router_stream(args):
+    main = import_app("modelrouter", "main")
+    agent = main.AsyncModelRouterAgent("You are a CSPM triage assistant.")
+
+    async def op(session, iteration):
+        start = time.perf_counter()
+        ttft = None
+        async for _ in agent.run_stream(QUERY):
+            if ttft is None:
+                ttft = time.perf_counter() - start
+        return {"ttft": ttft}
+    return op
+
+
+def scenario_chat_stream(args):
+    app = import_app("groq-chat", "app")
+
+    async def op(session, iteration):
+        start = time.perf_counter()
+        ttft = None
+        stream = await app.get_client().chat.completions.create(
+            model="llama3-8b-8192",
+            messages=[{"role": "system", "content": "You are a helpful assistant."}, {"role": "user", "content": QUERY}],
+            tools=app.tools,
+            tool_choice="none",
+            max_tokens=4096,
+            stream=True,
+        )
+        async for chunk in stream:
+            if ttft is None and chunk.choices and chunk.choices[0].delta.content:
+                ttft = time.perf_counter() - start
+        return {"ttft": ttft}
+    return op
+
+
+def scenario_chat_search(args):
+    app = import_app("groq-chat", "app")
+
+    async def op(session, iteration):
+        await app.async_search(f"{QUERY} {session}-{iteration}")
+        return {}
+    return op
+
+
+def scenario_groq_exa(args):
+    # The CLI runs end to end in a subprocess, the query is fed on stdin
+    script = os.path.join(REPO_ROOT, "groq-exa", "exa.py")
+
+    async def op(session, iteration):
+        process = await asyncio.create_subprocess_exec(
+            sys.executable, script,
+            stdin=subprocess.PIPE, stdout=subprocess.DEVNULL, stderr=subprocess.PIPE,
+            cwd=os.path.dirname(script),
+        )
+        _, stderr = await process.communicate(f"{QUERY}\n".encode("utf-8"))
+        if process.returncode != 0:
+            raise RuntimeError(stderr.decode("utf-8", "replace")[-500:])
+        return {}
+    return op
+
+
+SCENARIOS = {
+    "router": scenario_router,
+    "router-stream": scenario_router_stream,
+    "chat-stream": scenario_chat_stream,
+    "chat-search": scenario_chat_search,
+    "groq-exa": scenario_groq_exa,
+}
+
+
+# App modules timed by the import-time target: name -> (folder, module)
+IMPORT_TARGETS = {
+    "groq-exa": ("groq-exa", "exa"),
+    "groq-chat": ("groq-chat", "app"),
+    "modelrouter": ("modelrouter", "main"),
+    "semantic-kernel": (os.path.join("llm-examples", "semantic_kernel"), "agent"),
+}
+
+
+def parse_importtime(stderr, module):
+    """
+    Read the output of python -X importtime
+
+    @return: (cumulative seconds of the module, its direct imports as (name, seconds) slowest first)
+    """
+    total, children, pending = None, [], []
+    for line in stderr.splitlines():
+        if not line.startswith("import time:") or "|" not in line:
+            continue
+        _, cumulative, name = line.split("|")
+        try:
+            seconds = int(cumulative) / 1e6
+        except ValueError:
+            continue
+        depth = (len(name) - len(name.lstrip())) // 2
+        # Children are printed before their parent, one indent level deeper
+        if depth == 1:
+            pending.append((name.strip(), seconds))
+        elif depth == 0:
+            if name.strip() == module:
+                total, children = seconds, pending
+            pending = []
+    return total, sorted(children, key=lambda item: -item[1])
+
+
+def profile_import(folder, module, runs=5):
+    """
+    Time a cold import of an app module in fresh interpreters
+
+    @param folder: Folder under the repo root
+    @param module: Module to import
+    @param runs: Interpreters to start, the median is reported
+    @return: Dict with the median import and process seconds and the slowest direct imports
+    """
+    import_times, process_times, children = [], [], []
+    for _ in range(runs):
+        start = time.perf_counter()
+        result = subprocess.run(
+            [sys.executable, "-X", "importtime", "-c", f"import {module}"],
+            cwd=os.path.join(REPO_ROOT, folder), capture_output=True, text=True,
+        )
+        process_times.append(time.perf_counter() - start)
+        if result.returncode != 0:
+            lines = result.stderr.strip().splitlines()
+            return {"error": lines[-1] if lines else f"exit code {result.returncode}"}
+        total, children = parse_importtime(result.stderr, module)
+        import_times.append(total)
+    return {
+        "import_seconds": percentile(import_times, 0.5),
+        "process_seconds": percentile(process_times, 0.5),
+        "slowest_imports": [{"module": name, "seconds": seconds} for name, seconds in children[:5]],
+    }
+
+
+def check_import_regression(result, baseline, max_regression):
+    failures = []
+    for name, current in result["modules"].items():
+        previous = baseline.get("modules", {}).get(name, {})
+        if not current.get("import_seconds") or not previous.get("import_seconds"):
+            continue
+        change = (current["import_seconds"] - previous["import_seconds"]) / previous["import_seconds"]
+        if change > max_regression:
+            failures.append(f"{name} import regressed {change:+.1%} ({previous['import_seconds']:.4g} -> {current['import_seconds']:.4g})")
+    return failures
+
+
+def percentile(values, q):
+    if not values:
+        return None
+    ordered = sorted(values)
+    index = min(len(ordered) - 1, max(0, round(q * (len(ordered) - 1))))
+    return ordered[index]
+
+
+def summarize(values):
+    return {
+        "p50": percentile(values, 0.50),
+        "p95": percentile(values, 0.95),
+        "p99": percentile(values, 0.99),
+        "max": max(values) if values else None,
+    }
+
+
+async def loop_lag_probe(lags, stop, interval=0.01):
+    # A blocked event loop shows up as sleeps that overshoot their interval
+    while not stop.is_set():
+        start = time.perf_counter()
+        await asyncio.sleep(interval)
+        lags.append(time.perf_counter() - start - interval)
+
+
+async def run_benchmark(op, sessions, iterations):
+    latencies, ttfts, lags, errors = [], [], [], []
+    stop = asyncio.Event()
+    probe = asyncio.create_task(loop_lag_probe(lags, stop))
+
+    async def session(session_id):
+        for iteration in range(iterations):
+            start = time.perf_counter()
+            try:
+                extra = await op(session_id, iteration)
+            except Exception as e:
+                errors.append(f"{type(e).__name__}: {e}")
+                continue
+            latencies.append(time.perf_counter() - start)
+            if extra.get("ttft") is not None:
+                ttfts.append(extra["ttft"])
+
+    tracemalloc.start()
+    start = time.perf_counter()
+    await asyncio.gather(*(session(i) for i in range(sessions)))
+    elapsed = time.perf_counter() - start
+    _, peak = tracemalloc.get_traced_memory()
+    tracemalloc.stop()
+    stop.set()
+    await probe
+
+    return {
+        "sessions": sessions,
+        "iterations": iterations,
+        "completed": len(latencies),
+        "errors": len(errors),
+        "error_samples": errors[:5],
+        "elapsed_seconds": elapsed,
+        "throughput_per_second": len(latencies) / elapsed if elapsed else 0.0,
+        "latency_seconds": summarize(latencies),
+        "ttft_seconds": summarize(ttfts),
+        "event_loop_lag_seconds": summarize(lags),
+        "peak_memory_bytes": peak,
+        "memory_per_session_bytes": peak / sessions if sessions else 0,
+    }
+
+
+def check_regression(result, baseline, max_regression):
+    """
+    Compare against a saved baseline
+
+    @return: List of regressions, empty when within max_regression
+    """
+    failures = []
+    checks = (
+        ("latency p95", result["latency_seconds"]["p95"], baseline["latency_seconds"]["p95"], True),
+        ("ttft p95", result["ttft_seconds"]["p95"], baseline["ttft_seconds"]["p95"], True),
+        ("memory per session", result["memory_per_session_bytes"], baseline["memory_per_session_bytes"], True),
+        ("throughput", result["throughput_per_second"], baseline["throughput_per_second"], False),
+    )
+    for name, current, previous, lower_is_better in checks:
+        if current is None or not previous:
+            continue
+        change = (current - previous) / previous
+        if (lower_is_better and change > max_regression) or (not lower_is_better and -change > max_regression):
+            failures.append(f"{name} regressed {change:+.1%} ({previous:.4g} -> {current:.4g})")
+    if result["errors"] > baseline.get("errors", 0):
+        failures.append(f"errors went from {baseline.get('errors', 0)} to {result['errors']}")
+    return failures
+
+
+if __name__ == "__main__":
+    parser = argparse.ArgumentParser(description="Offline load test of the chat, search and router paths against the mock server")
+    parser.add_argument("scenario", choices=sorted(SCENARIOS) + ["import-time"], help="import-time profiles cold imports of the apps instead")
+    parser.add_argument("--sessions", type=int, default=50, help="Concurrent sessions")
+    parser.add_argument("--iterations", type=int, default=5, help="Operations per session, or interpreters per app for import-time")
+    parser.add_argument("--port", type=int, default=8900)
+    parser.add_argument("--latency", type=float, default=0.2, help="Mock seconds to first byte")
+    parser.add_argument("--token-delay", type=float, default=0.005, help="Mock seconds per streamed token")
+    parser.add_argument("--search-latency", type=float, default=0.5, help="Mock seconds per Exa search")
+    parser.add_argument("--error-rate", type=float, default=0.0, help="Fraction of mock 500s")
+    parser.add_argument("--rate-limit-rate", type=float, default=0.0, help="Fraction of mock 429s")
+    parser.add_argument("--save", help="Write the result JSON here, e.g. to use as a baseline")
+    parser.add_argument("--baseline", help="Fail if the result regresses against this saved result")
+    parser.add_argument("--max-regression", type=float, default=0.15, help="Allowed relative regression")
+    args = parser.parse_args()
+
+    if args.scenario == "import-time":
+        result = {
+            "scenario": args.scenario,
+            "modules": {name: profile_import(folder, module, args.iterations) for name, (folder, module) in IMPORT_TARGETS.items()},
+        }
+        print(json.dumps(result, indent=2))
+        if args.save:
+            with open(args.save, "w") as file:
+                json.dump(result, file, indent=2)
+        if args.baseline:
+            with open(args.baseline) as file:
+                failures = check_import_regression(result, json.load(file), args.max_regression)
+            for failure in failures:
+                print("REGRESSION:", failure)
+            sys.exit(1 if failures else 0)
+        sys.exit(0)
+
+    config = MockConfig(
+        latency=args.latency,
+        token_delay=args.token_delay,
+        search_latency=args.search_latency,
+        error_rate=args.error_rate,
+        rate_limit_rate=args.rate_limit_rate,
+    )
+    server = serve(port=args.port, config=config)
+    mock_env(f"http://127.0.0.1:{args.port}")
+
+    op = SCENARIOS[args.scenario](args)
+    result = asyncio.run(run_benchmark(op, args.sessions, args.iterations))
+    result["scenario"] = args.scenario
+    server.shutdown()
+
+    print(json.dumps(result, indent=2))
+    if args.save:
+        with open(args.save, "w") as file:
+            json.dump(result, file, indent=2)
+    if args.baseline:
+        with open(args.baseline) as file:
+            failures = check_regression(result, json.load(file), args.max_regression)
+        for failure in failures:
+            print("REGRESSION:", failure)
+        sys.exit(1 if failures else 0)
@@ -0,0 +1,267 @@
+import argparse
+import json
+import random
+import threading
+import time
+import uuid
+from http.server import BaseHTTPRequestHandler, ThreadingHTTPServer
+
+# Local stand-in for Groq / OpenAI / Azure OpenAI chat completions and Exa search.
+# Point the apps at it with GROQ_BASE_URL, AZURE_ENDPOINT and EXA_BASE_URL.
+
+
+class MockConfig:
+    def __init__(self, latency=0.2, jitter=0.05, token_delay=0.005, tokens=200, error_rate=0.0, rate_limit_rate=0.0, search_latency=0.5, search_results=5, snippet_chars=4000, routed_model="gpt-4.1-mini-2025-04-14"):
+        """
+        @param latency: Seconds before the first byte of every completion
+        @param jitter: Random +/- seconds added to every latency
+        @param token_delay: Seconds between streamed tokens (also applied to non-streamed bodies)
+        @param tokens: Tokens in each text answer
+        @param error_rate: Fraction of requests answered with a 500
+        @param rate_limit_rate: Fraction of requests answered with a 429 and retry-after
+        @param search_latency: Seconds an Exa search takes
+        @param search_results: Results per Exa search
+        @param snippet_chars: Characters of text per Exa result
+        @param routed_model: Model reported by Azure deployments, like the model router does
+        """
+        self.latency = latency
+        self.jitter = jitter
+        self.token_delay = token_delay
+        self.tokens = tokens
+        self.error_rate = error_rate
+        self.rate_limit_rate = rate_limit_rate
+        self.search_latency = search_latency
+        self.search_results = search_results
+        self.snippet_chars = snippet_chars
+        self.routed_model = routed_model
+        self.lock = threading.Lock()
+        self.requests = {}
+
+    def count(self, kind):
+        with self.lock:
+            self.requests[kind] = self.requests.get(kind, 0) + 1
+
+    def sleep(self, seconds):
+        time.sleep(max(0.0, seconds + random.uniform(-self.jitter, self.jitter)))
+
+
+WORDS = ("prompt injection model security guardrail data poisoning evaluation agent "
+         "jailbreak retrieval adversarial red team supply chain output handling").split()
+
+
+def answer_tokens(count):
+    return [random.choice(WORDS) + " " for _ in range(count)]
+
+
+def wants_tool_call(body):
+    # Call a tool when tools are offered and the conversation hasn't seen a tool result yet
+    if not body.get("tools") or body.get("tool_choice") == "none":
+        return False
+    return not any(message.get("role") in ("tool", "function") for message in body.get("messages", []))
+
+
+def last_user_text(body):
+    for message in reversed(body.get("messages", [])):
+        if message.get("role") == "user":
+            content = message.get("content")
+            if isinstance(content, list):
+                return " ".join(part.get("text", "") for part in content if isinstance(part, dict))
+            return content or ""
+    return ""
+
+
+class MockHandler(BaseHTTPRequestHandler):
+    protocol_version = "HTTP/1.1"
+    # Streamed chunks are tiny, don't let Nagle hold them back
+    disable_nagle_algorithm = True
+    config = MockConfig()
+
+    def log_message(self, format, *args):
+        pass
+
+    def read_body(self):
+        length = int(self.headers.get("content-length") or 0)
+        return json.loads(self.rfile.read(length) or b"{}")
+
+    def send_json(self, status, payload, headers=None):
+        data = json.dumps(payload).encode("utf-8")
+        self.send_response(status)
+        self.send_header("content-type", "application/json")
+        self.send_header("content-length", str(len(data)))
+        for key, value in (headers or {}).items():
+            self.send_header(key, value)
+        self.end_headers()
+        self.wfile.write(data)
+
+    def inject_error(self):
+        roll = random.random()
+        if roll < self.config.rate_limit_rate:
+            self.send_json(429, {"error": {"message": "Rate limit reached", "type": "rate_limit"}},
+                           {"retry-after": "1", "x-ratelimit-remaining-requests": "0"})
+            return True
+        if roll < self.config.rate_limit_rate + self.config.error_rate:
+            self.send_json(500, {"error": {"message": "Injected server error", "type": "server_error"}})
+            return True
+        return False
+
+    def do_GET(self):
+        if self.path.rstrip("/") == "/stats":
+            with self.config.lock:
+                return self.send_json(200, dict(self.config.requests))
+        self.send_json(404, {"error": "not found"})
+
+    def do_POST(self):
+        body = self.read_body()
+        path = self.path.split("?")[0]
+        if path.endswith("/chat/completions"):
+            self.config.count("chat")
+            if self.inject_error():
+                return
+            model = body.get("model") or "mock"
+            if "/deployments/" in path:
+                model = self.config.routed_model
+            self.config.sleep(self.config.latency)
+            if body.get("stream"):
+                return self.stream_completion(body, model)
+            return self.completion(body, model)
+        if path.endswith("/search"):
+            self.config.count("search")
+            if self.inject_error():
+                return
+            return self.search(body)
+        self.send_json(404, {"error": "not found"})
+
+    def completion(self, body, model):
+        prompt_tokens = sum(len(str(m.get("content") or "")) // 4 for m in body.get("messages", []))
+        if wants_tool_call(body):
+            message = {
+                "role": "assistant",
+                "content": None,
+                "tool_calls": [{
+                    "id": f"call_{uuid.uuid4().hex[:12]}",
+                    "type": "function",
+                    "function": {"name": body["tools"][0]["function"]["name"], "arguments": json.dumps({"query": last_user_text(body)})},
+                }],
+            }
+            finish_reason, completion_tokens = "tool_calls", 20
+        else:
+            tokens = answer_tokens(min(self.config.tokens, body.get("max_tokens") or self.config.tokens))
+            time.sleep(self.config.token_delay * len(tokens))
+            message = {"role": "assistant", "content": "".join(tokens)}
+            finish_reason, completion_tokens = "stop", len(tokens)
+        self.send_json(200, {
+            "id": f"chatcmpl-{uuid.uuid4().hex}",
+            "object": "chat.completion",
+            "created": int(time.time()),
+            "model": model,
+            "choices": [{"index": 0, "message": message, "finish_reason": finish_reason, "logprobs": None}],
+            "usage": {"prompt_tokens": prompt_tokens, "completion_tokens": completion_tokens, "total_tokens": prompt_tokens + completion_tokens},
+        }, {"x-ratelimit-remaining-requests": "1000", "x-ratelimit-remaining-tokens": "100000"})
+
+    def stream_completion(self, body, model):
+        self.send_response(200)
+        self.send_header("content-type", "text/event-stream")
+        self.send_header("transfer-encoding", "chunked")
+        self.end_headers()
+        completion_id = f"chatcmpl-{uuid.uuid4().hex}"
+
+        def send(delta, finish_reason=None, usage=None):
+            chunk = {
+                "id": completion_id,
+                "object": "chat.completion.chunk",
+                "created": int(time.time()),
+                "model": model,
+                "choices": [{"index": 0, "delta": delta, "finish_reason": finish_reason, "logprobs": None}] if delta is not None else [],
+            }
+            if usage:
+                chunk["usage"] = usage
+            self.write_chunk(f"data: {json.dumps(chunk)}\n\n")
+
+        if wants_tool_call(body):
+            arguments = json.dumps({"query": last_user_text(body)})
+            call_id = f"call_{uuid.uuid4().hex[:12]}"
+            name = body["tools"][0]["function"]["name"]
+            send({"role": "assistant", "content": None, "tool_calls": [{"index": 0, "id": call_id, "type": "function", "function": {"name": name, "arguments": ""}}]})
+            # Arguments arrive in fragments, like the real APIs
+            for start in range(0, len(arguments), 8):
+                time.sleep(self.config.token_delay)
+                send({"tool_calls": [{"index": 0, "function": {"arguments": arguments[start:start + 8]}}]})
+            send({}, "tool_calls")
+            completion_tokens = 20
+        else:
+            tokens = answer_tokens(min(self.config.tokens, body.get("max_tokens") or self.config.tokens))
+            send({"role": "assistant", "content": ""})
+            for token in tokens:
+                time.sleep(self.config.token_delay)
+                send({"content": token})
+            send({}, "stop")
+            completion_tokens = len(tokens)
+        if (body.get("stream_options") or {}).get("include_usage"):
+            send(None, usage={"prompt_tokens": 0, "completion_tokens": completion_tokens, "total_tokens": completion_tokens})
+        self.write_chunk("data: [DONE]\n\n")
+        self.write_chunk("")
+
+    def write_chunk(self, text):
+        data = text.encode("utf-8")
+        self.wfile.write(f"{len(data):x}\r\n".encode("ascii") + data + b"\r\n")
+        self.wfile.flush()
+
+    def search(self, body):
+        self.config.sleep(self.config.search_latency)
+        count = min(body.get("numResults") or self.config.search_results, self.config.search_results)
+        query = body.get("query", "")
+        results = []
+        for i in range(count):
+            results.append({
+                "id": f"https://arxiv.org/abs/2401.{i:05d}",
+                "url": f"https://arxiv.org/abs/2401.{i:05d}",
+                "title": f"{query} - mock paper {i}",
+                "score": round(1 - i * 0.05, 3),
+                "publishedDate": "2024-05-01",
+                "author": "Mock Author",
+                "text": ("".join(answer_tokens(self.config.snippet_chars // 8)))[: self.config.snippet_chars],
+            })
+        self.send_json(200, {"results": results, "autopromptString": query, "requestId": uuid.uuid4().hex})
+
+
+def serve(host="127.0.0.1", port=8900, config=None):
+    """
+    Start the mock server on a background thread
+
+    @return: The running ThreadingHTTPServer, call shutdown() to stop it
+    """
+    handler = type("ConfiguredMockHandler", (MockHandler,), {"config": config or MockConfig()})
+    server = ThreadingHTTPServer((host, port), handler)
+    server.daemon_threads = True
+    threading.Thread(target=server.serve_forever, daemon=True).start()
+    return server
+
+
+if __name__ == "__main__":
+    parser = argparse.ArgumentParser(description="Mock Groq/OpenAI/Azure chat completions and Exa search server")
+    parser.add_argument("--host", default="127.0.0.1")
+    parser.add_argument("--port", type=int, default=8900)
+    parser.add_argument("--latency", type=float, default=0.2)
+    parser.add_argument("--jitter", type=float, default=0.05)
+    parser.add_argument("--token-delay", type=float, default=0.005)
+    parser.add_argument("--tokens", type=int, default=200)
+    parser.add_argument("--error-rate", type=float, default=0.0)
+    parser.add_argument("--rate-limit-rate", type=float, default=0.0)
+    parser.add_argument("--search-latency", type=float, default=0.5)
+    args = parser.parse_args()
+
+    config = MockConfig(
+        latency=args.latency,
+        jitter=args.jitter,
+        token_delay=args.token_delay,
+        tokens=args.tokens,
+        error_rate=args.error_rate,
+        rate_limit_rate=args.rate_limit_rate,
+        search_latency=args.search_latency,
+    )
+    server = serve(args.host, args.port, config)
+    print(f"Mock server listening on http://{args.host}:{args.port}")
+    try:
+        threading.Event().wait()
+    except KeyboardInterrupt:
+        server.shutdown()
@@ -1,30 +1,89 @@
 import json
 import ast
+import asyncio
+import logging
 import os
-from groq import Groq, AsyncGroq
+import time
+from concurrent.futures import ThreadPoolExecutor
+from functools import lru_cache
+from types import SimpleNamespace
 from dotenv import load_dotenv
-from exa_py import Exa
+from search_cache import SearchCache, cache_from_env
+from completion_cache import CompletionCache, completion_cache_from_env
+from compaction import compact_results
+from history import trim_history, history_tokens
+from rate_limiter import limiter_for, estimate_tokens
+import tracing
 import chainlit as cl
 
 
 # Load environment variables
 load_dotenv()
+# Spans go to TRACE_PATH when it's set, see tracing.py
+tracing.configure(service_name="groq-chat")
 
 # Variables that are needed for Groq and Exa
 api_key = os.environ.get("GROQ_API_KEY")
 
+logger = logging.getLogger(__name__)
+
+
+# Clients and caches are built on first use so the worker starts without importing the SDKs
+# or opening the cache files, each worker process then reuses the same instances
+@lru_cache(maxsize=None)
+def get_client():
+    from groq import AsyncGroq, DefaultAsyncHttpxClient
+
+    # Async call to Azure OpenAI, the response hook records every HTTP attempt (retries included) on the current span
+    return AsyncGroq(
+        api_key=os.getenv("GROQ_API_KEY"),
+        http_client=DefaultAsyncHttpxClient(event_hooks={"response": [tracing.on_http_response_async]}),
+    )
+
 
-# Async call to Azure OpenAI
-client = AsyncGroq(
-    api_key=os.getenv("GROQ_API_KEY")
-)
 # Initialize Exa Client
-exa = Exa(api_key=os.getenv("EXA_API_KEY"))
+@lru_cache(maxsize=None)
+def get_exa():
+    from exa_py import Exa
+
+    return Exa(api_key=os.getenv("EXA_API_KEY"), base_url=os.getenv("EXA_BASE_URL", "https://api.exa.ai"))
 
 
 
 MAX_ITER = 5
 
+# Stream tokens to the UI as they arrive instead of waiting for the full completion
+STREAM_RESPONSES = os.getenv("STREAM_RESPONSES", "true").lower() in ("1", "true", "yes")
+
+# Exa SDK is synchronous so searches run on a bounded thread pool to keep the event loop free
+SEARCH_TIMEOUT = float(os.getenv("EXA_SEARCH_TIMEOUT", "20"))
+SEARCH_WORKERS = int(os.getenv("EXA_SEARCH_WORKERS", "8"))
+search_executor = ThreadPoolExecutor(max_workers=SEARCH_WORKERS, thread_name_prefix="exa-search")
+# Maximum number of tool calls from a single model turn that run at once
+TOOL_CONCURRENCY = int(os.getenv("TOOL_CONCURRENCY", "5"))
+
+# Search results are cached on the normalized query plus every search parameter
+@lru_cache(maxsize=None)
+def get_search_cache():
+    return cache_from_env()
+
+
+# Identical requests are answered from the cache without calling Groq, off unless COMPLETION_CACHE is set
+@lru_cache(maxsize=None)
+def get_completion_cache():
+    return completion_cache_from_env()
+
+
+SEARCH_PARAMS = {
+    "type": "neural",
+    "use_autoprompt": True,
+    "num_results": 10,
+    "text": True,
+    "include_domains": ["arxiv.org", "bing.com"],
+    "start_published_date": "2023-12-31",
+    "end_published_date": "2024-08-11",
+}
+
 cl.instrument_openai()
 
 
@@ -40,16 +99,21 @@ def search(query: str) -> list:
 
     """
     try:
-        result = exa.search_and_contents(
-            query=query,
-            type="neural",
-            use_autoprompt=True,
-            num_results=10,
-            text=True,
-            include_domains=["arxiv.org", "bing.com"],
-            start_published_date="2023-12-31",
-            end_published_date="2024-08-11",
-    )
+        # The cache holds the raw results, compaction runs on every call so its limits can change
+        search_cache = get_search_cache()
+        cache_key = SearchCache.make_key(query, SEARCH_PARAMS)
+        with tracing.span("cache.lookup", {"cache.name": "search"}) as lookup:
+            cached = search_cache.get(cache_key)
+            lookup.set_attribute("cache.hit", cached is not None)
+            record_cache_stats(lookup, "search", search_cache)
+        if cached is not None:
+            return compact(query, json.loads(cached), len(cached))
+
+        with tracing.span("exa.search", {"search.query": query}, kind="client") as exa_span:
+            with limiter_for("exa").limit() as slot:
+                exa_span.set_attribute("ratelimit.wait_seconds", slot.waited)
+                result = get_exa().search_and_contents(query=query, **SEARCH_PARAMS)
+            exa_span.set_attribute("search.results", len(result.results))
 
         output = []
 
@@ -63,10 +127,49 @@ def search(query: str) -> list:
                 "publish": item.published_date,
             })
 
-        return json.dumps(output)
+        raw_output = json.dumps(output)
+        search_cache.set(cache_key, raw_output)
+        return compact(query, output, len(raw_output))
     except Exception as e:
         print("failed to search for query: ", query)
-        return json.dumps({"error": str(e)})        
+        return json.dumps({"error": str(e)})
+
+
+def record_cache_stats(span, name: str, cache):
+    # Running totals go on the lookup span and the debug log instead of the server output on every call
+    if tracing.enabled() or logger.isEnabledFor(logging.DEBUG):
+        stats = cache.stats()
+        span.set_attributes({f"cache.{key}": value for key, value in stats.items()})
+        logger.debug("%s cache: %s", name, stats)
+
+
+def compact(query: str, results: list, raw_bytes: int = None) -> str:
+    # Only the passages relevant to the query go to the model
+    with tracing.span("search.compact", {"search.results": len(results)}) as compact_span:
+        output = json.dumps(compact_results(query, results))
+        compact_span.set_attributes({"bytes.in": raw_bytes, "bytes.out": len(output)})
+    return output
+
+
+async def async_search(query: str) -> str:
+    """
+    Run the blocking Exa search on the search thread pool
+
+    @param query: Search query
+    @return: JSON string of search results or an error
+
+    """
+    loop = asyncio.get_running_loop()
+    # Cancelling this coroutine also drops the job if it is still queued in the pool
+    # The pool threads don't inherit the caller's context, bind the span the search belongs to
+    future = loop.run_in_executor(search_executor, tracing.propagate(search), query)
+    try:
+        return await asyncio.wait_for(future, timeout=SEARCH_TIMEOUT)
+    except asyncio.TimeoutError:
+        print("search timed out for query: ", query)
+        return json.dumps({"error": f"search timed out after {SEARCH_TIMEOUT}s"})
+
+
 tools = [
         {
             "type": "function",
@@ -94,10 +197,19 @@ def start_chat():
         "message_history",
         [{"role": "system", "content": "You are a helpful assistant."}],
     )
+    # Searches still running for this session, cancelled if the user leaves
+    cl.user_session.set("pending_searches", set())
+
+
+@cl.on_stop
+@cl.on_chat_end
+def cancel_searches():
+    for task in cl.user_session.get("pending_searches") or set():
+        task.cancel()
 
 
 @cl.step(type="tool")
-async def call_tool(tool_call, message_history):
+async def call_tool(tool_call):
     function_name = tool_call.function.name
     arguments = ast.literal_eval(tool_call.function.arguments)
 
@@ -106,21 +218,39 @@ async def call_tool(tool_call, message_history):
 
     current_step.input = arguments
 
-    function_response = search(
-        query=arguments.get("query"),
-    )
+    pending_searches = cl.user_session.get("pending_searches")
+    with tracing.span("tool.call", {"tool.name": function_name, "tool.call_id": tool_call.id, "search.query": arguments.get("query")}) as tool_span:
+        task = asyncio.ensure_future(async_search(query=arguments.get("query")))
+        pending_searches.add(task)
+        try:
+            function_response = await task
+        finally:
+            pending_searches.discard(task)
+        tool_span.set_attribute("bytes.out", len(function_response))
 
     current_step.output = function_response
     current_step.language = "json"
 
-    message_history.append(
-        {
-            "role": "function",
-            "name": function_name,
-            "content": function_response,
-            "tool_call_id": tool_call.id,
-        }
+    return {
+        "role": "function",
+        "name": function_name,
+        "content": function_response,
+        "tool_call_id": tool_call.id,
+    }
+
+
+async def limited_call(tool_call, semaphore):
+    async with semaphore:
+        return await call_tool(tool_call)
+
+
+async def call_tools(tool_calls, message_history):
+    # Fan out the tool calls of one turn, results are appended in the original tool_call order
+    semaphore = asyncio.Semaphore(TOOL_CONCURRENCY)
+    results = await asyncio.gather(
+        *(limited_call(tool_call, semaphore) for tool_call in tool_calls if tool_call.type == "function")
     )
+    message_history.extend(results)
 
 
 async def call_groq(message_history):
@@ -132,13 +262,61 @@ async def call_groq(message_history):
         "max_tokens": 4096,
     }
 
-    response = await client.chat.completions.create(**settings)
+    # The key is taken before the tool results are appended to the history
+    completion_cache = get_completion_cache()
+    cache_key = None
+    if completion_cache is not None:
+        with tracing.span("cache.lookup", {"cache.name": "completion"}) as lookup:
+            cache_key = CompletionCache.request_key(settings)
+            cached = completion_cache.get(cache_key)
+            lookup.set_attribute("cache.hit", cached is not None)
+            record_cache_stats(lookup, "completion", completion_cache)
+        if cached is not None:
+            from groq.types.chat import ChatCompletion
+
+            response = ChatCompletion.model_validate_json(cached)
+            return await handle_completion(response.choices[0].message, message_history)
+
+    if STREAM_RESPONSES:
+        return await call_groq_stream(message_history, settings, cache_key)
+
+    # Chat turns are interactive, the shared limiter serves them ahead of any batch work
+    limiter = limiter_for("groq", settings["model"])
+    estimated = estimate_tokens(message_history, settings["max_tokens"])
+    with tracing.span("llm.call", llm_attributes(settings, estimated, stream=False), kind="client") as llm_span:
+        async with limiter.limit_async(estimated) as slot:
+            llm_span.set_attribute("ratelimit.wait_seconds", slot.waited)
+            raw = await get_client().chat.completions.with_raw_response.create(**settings)
+            response = await raw.parse()
+            slot.observe(raw.headers, response.usage.total_tokens if response.usage else None)
+        llm_span.set_attributes(tracing.usage_attributes(response.usage))
+        llm_span.set_attributes({
+            "llm.finish_reason": response.choices[0].finish_reason,
+            "llm.tool_calls": len(response.choices[0].message.tool_calls or []),
+        })
+    if cache_key is not None:
+        completion_cache.set(cache_key, response.model_dump_json())
+
+    return await handle_completion(response.choices[0].message, message_history)
+
+
+def llm_attributes(settings: dict, estimated: int, stream: bool) -> dict:
+    attributes = {
+        "llm.model": settings["model"],
+        "llm.stream": stream,
+        "llm.messages": len(settings["messages"]),
+        "llm.max_tokens": settings["max_tokens"],
+        "llm.estimated_tokens": estimated,
+    }
+    if tracing.enabled():
+        # Serializing the history isn't free, only measure it while tracing
+        attributes["bytes.in"] = len(json.dumps(settings["messages"], default=str))
+    return attributes
 
-    message_completions = response.choices[0].message
 
-    for tool_call in message_completions.tool_calls or []:
-        if tool_call.type == "function":
-            await call_tool(tool_call, message_history)
+async def handle_completion(message_completions, message_history):
+    if message_completions.tool_calls:
+        await call_tools(message_completions.tool_calls, message_history)
 
     if message_completions.content:
         cl.context.current_step.output = message_completions.content
@@ -152,6 +330,149 @@ async def call_groq(message_history):
     return message_completions
 
 
+def arguments_complete(arguments: str) -> bool:
+    # Streamed arguments are a JSON object, so they only parse once the closing brace arrives
+    try:
+        json.loads(arguments)
+        return True
+    except ValueError:
+        return False
+
+
+async def abort_stream(answer, tool_tasks: dict):
+    """
+    Clean up after a stream that failed or was cancelled part way through
+
+    @param answer: Partly streamed answer message, None if no content arrived
+    @param tool_tasks: Tool calls already started from the stream
+    """
+    for task in tool_tasks.values():
+        task.cancel()
+    await asyncio.gather(*tool_tasks.values(), return_exceptions=True)
+    if answer is not None:
+        answer.content += " [interrupted]"
+        await answer.send()
+
+
+async def call_groq_stream(message_history, settings, cache_key=None):
+    limiter = limiter_for("groq", settings["model"])
+    estimated = estimate_tokens(message_history, settings["max_tokens"])
+    answer = None
+    content = ""
+    tool_calls = {}
+    tool_tasks = {}
+    semaphore = asyncio.Semaphore(TOOL_CONCURRENCY)
+
+    # The span ends with the stream, tools started mid-stream are its children and may outlive it
+    with tracing.span("llm.call", llm_attributes(settings, estimated, stream=True), kind="client") as llm_span:
+        started = time.perf_counter()
+        first_token = None
+        async with limiter.limit_async(estimated) as slot:
+            llm_span.set_attribute("ratelimit.wait_seconds", slot.waited)
+            raw = await get_client().chat.completions.with_raw_response.create(**settings, stream=True)
+            slot.observe(raw.headers)
+        stream = await raw.parse()
+
+        try:
+            async for chunk in stream:
+                # Groq reports the usage on the last chunk, settle the estimate with it
+                usage = chunk.x_groq.usage if chunk.x_groq else None
+                if usage is not None:
+                    slot.observe(used_tokens=usage.total_tokens)
+                    llm_span.set_attributes(tracing.usage_attributes(usage))
+                if not chunk.choices:
+                    continue
+                delta = chunk.choices[0].delta
+                if first_token is None and (delta.content or delta.tool_calls):
+                    first_token = time.perf_counter() - started
+                    llm_span.set_attribute("llm.time_to_first_token", first_token)
+
+                if delta.content:
+                    if answer is None:
+                        answer = cl.Message(content="", author="Answer")
+                    content += delta.content
+                    await answer.stream_token(delta.content)
+
+                # Tool calls arrive as fragments keyed by index, stitch them back together
+                for fragment in delta.tool_calls or []:
+                    tool_call = tool_calls.get(fragment.index)
+                    if tool_call is None:
+                        tool_call = SimpleNamespace(
+                            id=None,
+                            type="function",
+                            function=SimpleNamespace(name="", arguments=""),
+                        )
+                        tool_calls[fragment.index] = tool_call
+                    if fragment.id:
+                        tool_call.id = fragment.id
+                    if fragment.function and fragment.function.name:
+                        tool_call.function.name += fragment.function.name
+                    if fragment.function and fragment.function.arguments:
+                        tool_call.function.arguments += fragment.function.arguments
+
+                    # Start the tool as soon as its arguments are complete, while the stream continues
+                    if fragment.index not in tool_tasks and arguments_complete(tool_call.function.arguments):
+                        tool_tasks[fragment.index] = asyncio.ensure_future(limited_call(tool_call, semaphore))
+        except BaseException:
+            # Tools started mid-stream would otherwise run on unawaited, and the answer would stay open
+            await abort_stream(answer, tool_tasks)
+            raise
+
+        llm_span.set_attribute("llm.tool_calls", len(tool_calls))
+
+    for index, tool_call in tool_calls.items():
+        if index not in tool_tasks:
+            tool_tasks[index] = asyncio.ensure_future(limited_call(tool_call, semaphore))
+
+    ordered = [tool_calls[index] for index in sorted(tool_calls)]
+    if cache_key is not None:
+        # Store the stitched stream in the same shape as a non-streamed completion
+        get_completion_cache().set(cache_key, json.dumps(stream_completion(settings["model"], content, ordered)))
+    if tool_tasks:
+        results = await asyncio.gather(*(tool_tasks[index] for index in sorted(tool_tasks)))
+        message_history.extend(results)
+
+    if answer is not None:
+        await answer.send()
+
+    if content:
+        cl.context.current_step.output = content
+
+    elif ordered:
+        cl.context.current_step.language = "json"
+        cl.context.current_step.output = ordered[0].function
+
+    return SimpleNamespace(content=content, tool_calls=ordered, streamed=answer is not None)
+
+
+def stream_completion(model: str, content: str, tool_calls: list) -> dict:
+    """
+    Build a chat.completion payload from a finished stream so it can be cached
+
+    @param model: Model the request was sent to
+    @param content: Streamed answer text
+    @param tool_calls: Stitched tool calls in index order
+    @return: Dict that ChatCompletion.model_validate accepts
+    """
+    message = {"role": "assistant", "content": content or None}
+    if tool_calls:
+        message["tool_calls"] = [
+            {
+                "id": tool_call.id,
+                "type": "function",
+                "function": {"name": tool_call.function.name, "arguments": tool_call.function.arguments},
+            }
+            for tool_call in tool_calls
+        ]
+    return {
+        "id": f"cached-{int(time.time() * 1000)}",
+        "object": "chat.completion",
+        "created": int(time.time()),
+        "model": model,
+        "choices": [{"index": 0, "message": message, "finish_reason": "tool_calls" if tool_calls else "stop"}],
+    }
+
+
 @cl.on_message
 async def run_conversation(message: cl.Message):
     message_history = cl.user_session.get("message_history")
@@ -159,10 +480,19 @@ async def run_conversation(message: cl.Message):
 
     cur_iter = 0
 
-    while cur_iter < MAX_ITER:
-        message = await call_groq(message_history)
-        if not message.tool_calls:
-            await cl.Message(content=message.content, author="Answer").send()
-            break
-
-        cur_iter += 1
\ No newline at end of file
+    # One trace per user message, model calls, tool calls and cache lookups nest under it
+    with tracing.span("chat.turn", {"chat.history_messages": len(message_history)}) as turn:
+        while cur_iter < MAX_ITER:
+            # Keep the stored history and the request payload inside the token budget
+            with tracing.span("history.trim", {"history.tokens_before": history_tokens(message_history)}) as trim_span:
+                message_history[:] = trim_history(message_history)
+                trim_span.set_attributes({"history.tokens": history_tokens(message_history), "history.messages": len(message_history)})
+            message = await call_groq(message_history)
+            if not message.tool_calls:
+                # Streamed answers have already been sent to the UI
+                if not getattr(message, "streamed", False):
+                    await cl.Message(content=message.content, author="Answer").send()
+                break
+
+            cur_iter += 1
+        turn.set_attribute("chat.tool_rounds", cur_iter)
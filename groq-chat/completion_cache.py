@@ -0,0 +1,59 @@
+# Shared module, copied into other projects. Edit groq-chat/completion_cache.py and run: python tools/sync_shared.py
+import hashlib
+import json
+import os
+from typing import Optional
+
+from search_cache import SearchCache
+
+# Request fields that change the completion, everything else (stream, timeouts) is left out
+KEY_FIELDS = ("model", "messages", "tools", "tool_choice", "max_tokens", "temperature")
+
+
+def _canonical(value):
+    # SDK objects (e.g. an assistant message appended to the history) hash by their fields
+    if hasattr(value, "model_dump"):
+        return value.model_dump(exclude_none=True)
+    return str(value)
+
+
+# Completions are cached like search results, same memory LRU and SQLite tiers in their own table
+class CompletionCache(SearchCache):
+    def __init__(self, path: str = ".completion_cache.sqlite", ttl: float = 3600, max_entries: int = 128, max_disk_entries: int = 5000, max_bytes: Optional[int] = 16 * 1024 * 1024):
+        """
+        @param path: SQLite file used for the on-disk tier, empty keeps the cache in memory only
+        @param ttl: Seconds a cached completion stays valid
+        @param max_entries: Size of the in-memory LRU tier
+        @param max_disk_entries: Rows kept on disk before the least recently used are evicted
+        @param max_bytes: Cap on the bytes of completions held by each tier
+        """
+        super().__init__(path, ttl, max_entries, max_disk_entries, max_bytes, table="completion_cache")
+
+    @staticmethod
+    def request_key(settings: dict) -> str:
+        """
+        Hash the fields of a chat.completions.create call that decide its output
+
+        @param settings: Keyword arguments of the create call
+        @return: Hex digest used as the cache key
+        """
+        request = {field: settings.get(field) for field in KEY_FIELDS}
+        raw = json.dumps(request, sort_keys=True, separators=(",", ":"), default=_canonical)
+        return hashlib.sha256(raw.encode("utf-8")).hexdigest()
+
+
+def completion_cache_from_env() -> Optional[CompletionCache]:
+    """
+    Build a CompletionCache when COMPLETION_CACHE is enabled, configured by
+    COMPLETION_CACHE_PATH, COMPLETION_CACHE_TTL, COMPLETION_CACHE_SIZE and COMPLETION_CACHE_MAX_BYTES
+
+    @return: Configured CompletionCache, or None when caching is off
+    """
+    if os.environ.get("COMPLETION_CACHE", "false").lower() not in ("1", "true", "yes"):
+        return None
+    return CompletionCache(
+        path=os.environ.get("COMPLETION_CACHE_PATH", ".completion_cache.sqlite"),
+        ttl=float(os.environ.get("COMPLETION_CACHE_TTL", "3600")),
+        max_entries=int(os.environ.get("COMPLETION_CACHE_SIZE", "128")),
+        max_bytes=int(os.environ.get("COMPLETION_CACHE_MAX_BYTES", str(16 * 1024 * 1024))),
+    )
@@ -0,0 +1,93 @@
+import json
+import os
+
+# Prompt budget for the history sent to the model, llama3-8b-8192 has 8192 tokens and
+# call_groq reserves max_tokens=4096 of them for the answer
+HISTORY_TOKEN_BUDGET = int(os.getenv("HISTORY_TOKEN_BUDGET", "3500"))
+# Older tool outputs are cut down to this many tokens before anything is dropped
+OLD_TOOL_TOKENS = int(os.getenv("HISTORY_OLD_TOOL_TOKENS", "150"))
+
+TOOL_ROLES = ("tool", "function")
+
+
+def count_tokens(text: str) -> int:
+    # Roughly 4 characters per token for English text, close enough for budgeting
+    return len(text) // 4 + 1
+
+
+def message_tokens(message: dict) -> int:
+    # Role, name and separators cost a few tokens on top of the content
+    return count_tokens(str(message.get("content") or "")) + 4
+
+
+def history_tokens(messages: list) -> int:
+    return sum(message_tokens(message) for message in messages)
+
+
+def summarize_tool_output(content: str, max_tokens: int) -> str:
+    """
+    Shrink an old tool result, search results keep only their titles and links
+
+    @param content: Tool message content
+    @param max_tokens: Token budget for the summary
+    @return: Summarized content
+    """
+    try:
+        results = json.loads(content)
+    except (TypeError, ValueError):
+        results = None
+    if isinstance(results, list) and all(isinstance(item, dict) for item in results):
+        summary = json.dumps([{"title": item.get("title"), "link": item.get("link")} for item in results])
+    else:
+        summary = str(content)
+    max_chars = max_tokens * 4
+    if len(summary) > max_chars:
+        summary = summary[:max_chars] + " [truncated]"
+    return summary
+
+
+def trim_history(messages: list, budget: int = HISTORY_TOKEN_BUDGET) -> list:
+    """
+    Fit the history in a token budget, keeping the system prompt and the latest turn
+
+    Older tool outputs are summarized first, then the oldest messages are dropped. If the
+    latest turn alone is still over budget its tool outputs are truncated to fit.
+
+    @param messages: Full message history
+    @param budget: Token budget for the whole history
+    @return: New list that fits in the budget
+    """
+    system = [m for m in messages[:1] if m.get("role") == "system"]
+    rest = messages[len(system):]
+
+    # The latest turn starts at the last user message
+    latest_start = 0
+    for index, message in enumerate(rest):
+        if message.get("role") == "user":
+            latest_start = index
+    older = [dict(m) for m in rest[:latest_start]]
+    latest = [dict(m) for m in rest[latest_start:]]
+
+    for message in older:
+        if message.get("role") in TOOL_ROLES:
+            message["content"] = summarize_tool_output(message.get("content"), OLD_TOOL_TOKENS)
+
+    fixed = history_tokens(system) + history_tokens(latest)
+    older_tokens = history_tokens(older)
+    while older and fixed + older_tokens > budget:
+        older_tokens -= message_tokens(older.pop(0))
+    # Don't start the window on a tool result whose user message was dropped
+    while older and older[0].get("role") in TOOL_ROLES:
+        older_tokens -= message_tokens(older.pop(0))
+
+    over = fixed - budget
+    tool_messages = [m for m in latest if m.get("role") in TOOL_ROLES]
+    if over > 0 and tool_messages:
+        # Leave room for the " [truncated]" marker added to each message
+        share = max(1, (history_tokens(tool_messages) - over) // len(tool_messages) - 8)
+        for message in tool_messages:
+            content = str(message.get("content") or "")
+            if count_tokens(content) > share:
+                message["content"] = content[: share * 4] + " [truncated]"
+
+    return system + older + latest
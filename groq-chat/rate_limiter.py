@@ -0,0 +1,356 @@
+# Shared module, copied into other projects. Edit groq-chat/rate_limiter.py and run: python tools/sync_shared.py
+import asyncio
+import os
+import re
+import threading
+import time
+from contextlib import asynccontextmanager, contextmanager
+from typing import Optional
+
+# Priority lanes, interactive callers are always served before batch work
+INTERACTIVE = 0
+BATCH = 1
+
+# Requests and tokens per minute used when no RATE_LIMIT_* variable is set, 0 means no limit.
+# Quotas differ per account and tier so nothing is limited until it's configured with
+# RATE_LIMIT_<PROVIDER>_RPM / _TPM or RATE_LIMIT_<PROVIDER>_<MODEL>_RPM / _TPM.
+# Unconfigured limiters still pause callers on a 429 for its retry-after
+DEFAULT_LIMITS = {}
+# Share of each bucket batch work leaves free for interactive callers
+BATCH_HEADROOM = float(os.environ.get("RATE_LIMIT_BATCH_HEADROOM", "0.2"))
+# Seconds of quota a bucket can hold, a full minute so a per-minute quota can be used in one burst.
+# Providers with shorter windows report it through x-ratelimit-remaining-* and 429s
+BURST_SECONDS = float(os.environ.get("RATE_LIMIT_BURST_SECONDS", "60"))
+# Completion tokens counted up front for each request, corrected from the usage once the response arrives
+COMPLETION_ESTIMATE = int(os.environ.get("RATE_LIMIT_COMPLETION_ESTIMATE", "1024"))
+# Longest single sleep while waiting, so header updates and priority changes are picked up
+MAX_SLEEP = 1.0
+
+DURATION_RE = re.compile(r"([\d.]+)(ms|h|m|s)")
+
+
+def parse_duration(value: Optional[str]) -> Optional[float]:
+    """
+    Parse the reset durations rate limit headers use, e.g. "1.5", "6ms", "7.66s" or "2m59.56s"
+
+    @return: Seconds, or None when the value can't be parsed
+    """
+    if not value:
+        return None
+    try:
+        return float(value)
+    except ValueError:
+        pass
+    units = {"ms": 0.001, "s": 1, "m": 60, "h": 3600}
+    parts = DURATION_RE.findall(value)
+    if not parts:
+        return None
+    return sum(float(number) * units[unit] for number, unit in parts)
+
+
+def retry_after(headers: dict) -> Optional[float]:
+    # retry-after-ms is more precise than retry-after when both are sent
+    if headers.get("retry-after-ms"):
+        try:
+            return float(headers["retry-after-ms"]) / 1000
+        except ValueError:
+            pass
+    return parse_duration(headers.get("retry-after"))
+
+
+def estimate_tokens(messages: list, max_tokens: Optional[int] = None) -> int:
+    """
+    Estimate the tokens a chat request will be charged before it is sent
+
+    @param messages: Chat messages, dicts or SDK message objects
+    @param max_tokens: The request's max_tokens, caps the completion estimate
+    @return: Estimated prompt plus completion tokens
+    """
+    prompt = 0
+    for message in messages:
+        content = message.get("content") if isinstance(message, dict) else getattr(message, "content", message)
+        # Roughly 4 characters per token plus a few for the role and separators
+        prompt += len(str(content or "")) // 4 + 4
+    completion = min(max_tokens, COMPLETION_ESTIMATE) if max_tokens else COMPLETION_ESTIMATE
+    return prompt + completion
+
+
+class TokenBucket:
+    def __init__(self, per_minute: float, burst_seconds: float = BURST_SECONDS):
+        """
+        @param per_minute: Sustained limit per minute
+        @param burst_seconds: Seconds of quota the bucket can hold
+        """
+        self.limit = per_minute / 60
+        # Current refill rate per second, lowered after 429s and recovered on success
+        self.rate = self.limit
+        self.capacity = max(1.0, self.limit * burst_seconds)
+        self.level = self.capacity
+        self.updated = time.monotonic()
+
+    def refill(self, now: float):
+        self.level = min(self.capacity, self.level + (now - self.updated) * self.rate)
+        self.updated = now
+
+    def wait_time(self, amount: float, reserve: float = 0.0) -> float:
+        # Requests bigger than the bucket only wait for a full bucket, otherwise they'd never run
+        needed = min(amount + reserve, self.capacity)
+        if self.level >= needed:
+            return 0.0
+        return (needed - self.level) / self.rate
+
+    def slow_down(self):
+        self.rate = max(self.limit * 0.1, self.rate * 0.75)
+
+    def recover(self):
+        self.rate = min(self.limit, self.rate + self.limit * 0.05)
+
+
+class Slot:
+    # Handed out by RateLimiter.limit so the caller can report what the response said
+    def __init__(self, limiter, estimated: int, waited: float = 0.0):
+        self.limiter = limiter
+        self.estimated = estimated
+        # Seconds spent waiting for the limiter before the request could go out
+        self.waited = waited
+
+    def observe(self, headers=None, used_tokens: Optional[int] = None, status: int = 200):
+        """
+        @param headers: Response headers, x-ratelimit-* and retry-after are applied to the limiter
+        @param used_tokens: Tokens actually used, refunds or charges the difference from the estimate
+        @param status: HTTP status of the response
+        """
+        if headers is not None:
+            self.limiter.observe(headers, status)
+        if used_tokens is not None:
+            self.limiter.settle(self.estimated, used_tokens)
+
+
+class RateLimiter:
+    """
+    Client-side scheduler for one provider and model, limiting requests and tokens
+
+    Both limits are token buckets refilled at the configured rate. The buckets are
+    set to whatever x-ratelimit-remaining-* the provider reports (up to their capacity,
+    so headers showing spare quota refill them as well as drain them), a 429
+    pauses every caller for retry-after and slows the refill until requests succeed
+    again. Batch callers wait while interactive callers are waiting and leave
+    BATCH_HEADROOM of each bucket free for them.
+    """
+
+    def __init__(self, requests_per_minute: float, tokens_per_minute: float = 0, name: str = ""):
+        """
+        @param requests_per_minute: Request limit, 0 for none
+        @param tokens_per_minute: Token limit, 0 for none
+        @param name: Shown in stats
+        """
+        self.name = name
+        self.requests = TokenBucket(requests_per_minute) if requests_per_minute else None
+        self.tokens = TokenBucket(tokens_per_minute) if tokens_per_minute else None
+        self.blocked_until = 0.0
+        self.interactive_waiting = 0
+        self.lock = threading.Lock()
+        self.acquired = {INTERACTIVE: 0, BATCH: 0}
+        self.waited = {INTERACTIVE: 0.0, BATCH: 0.0}
+        self.throttled = 0
+
+    def _buckets(self):
+        return [bucket for bucket in (self.requests, self.tokens) if bucket is not None]
+
+    def _try_acquire(self, tokens: int, priority: int) -> float:
+        # Take from both buckets when they allow it, otherwise return the seconds to wait
+        now = time.monotonic()
+        with self.lock:
+            if now < self.blocked_until:
+                return self.blocked_until - now
+            if priority != INTERACTIVE and self.interactive_waiting:
+                return 0.05
+            wait = 0.0
+            for bucket, amount in ((self.requests, 1), (self.tokens, tokens)):
+                if bucket is None:
+                    continue
+                bucket.refill(now)
+                reserve = bucket.capacity * BATCH_HEADROOM if priority != INTERACTIVE else 0.0
+                wait = max(wait, bucket.wait_time(amount, reserve))
+            if wait > 0:
+                return wait
+            if self.requests is not None:
+                self.requests.level -= 1
+            if self.tokens is not None:
+                self.tokens.level -= tokens
+            self.acquired[priority] += 1
+            return 0.0
+
+    def _enter(self, priority: int):
+        if priority == INTERACTIVE:
+            with self.lock:
+                self.interactive_waiting += 1
+
+    def _leave(self, priority: int, waited: float):
+        with self.lock:
+            if priority == INTERACTIVE:
+                self.interactive_waiting -= 1
+            self.waited[priority] += waited
+
+    def acquire(self, tokens: int = 0, priority: int = INTERACTIVE):
+        """
+        Block until a request costing `tokens` may be sent
+
+        @param tokens: Estimated tokens, see estimate_tokens
+        @param priority: INTERACTIVE or BATCH
+        @return: Seconds waited
+        """
+        start = time.monotonic()
+        self._enter(priority)
+        try:
+            while True:
+                wait = self._try_acquire(tokens, priority)
+                if not wait:
+                    return time.monotonic() - start
+                time.sleep(min(wait, MAX_SLEEP))
+        finally:
+            self._leave(priority, time.monotonic() - start)
+
+    async def acquire_async(self, tokens: int = 0, priority: int = INTERACTIVE):
+        # Same as acquire without blocking the event loop
+        start = time.monotonic()
+        self._enter(priority)
+        try:
+            while True:
+                wait = self._try_acquire(tokens, priority)
+                if not wait:
+                    return time.monotonic() - start
+                await asyncio.sleep(min(wait, MAX_SLEEP))
+        finally:
+            self._leave(priority, time.monotonic() - start)
+
+    def settle(self, estimated: int, used: int):
+        # Give back (or take) the difference between the estimate and what the response used
+        if self.tokens is None:
+            return
+        with self.lock:
+            self.tokens.refill(time.monotonic())
+            self.tokens.level = min(self.tokens.capacity, self.tokens.level + estimated - used)
+
+    def observe(self, headers, status: int = 200):
+        """
+        Adapt to the rate limit headers of a response
+
+        @param headers: Response headers (any mapping)
+        @param status: HTTP status, 429 pauses all callers for retry-after
+        """
+        headers = {key.lower(): value for key, value in headers.items()}
+        now = time.monotonic()
+        with self.lock:
+            for bucket, kind in ((self.requests, "requests"), (self.tokens, "tokens")):
+                remaining = headers.get(f"x-ratelimit-remaining-{kind}")
+                if bucket is None or remaining is None:
+                    continue
+                try:
+                    remaining = float(remaining)
+                except ValueError:
+                    continue
+                bucket.refill(now)
+                # The provider's count wins in both directions, it also sees other clients on the same key
+                bucket.level = min(bucket.capacity, remaining)
+                if remaining <= 0:
+                    reset = parse_duration(headers.get(f"x-ratelimit-reset-{kind}"))
+                    if reset:
+                        self.blocked_until = max(self.blocked_until, now + reset)
+            if status == 429:
+                self.throttled += 1
+                self.blocked_until = max(self.blocked_until, now + (retry_after(headers) or 1.0))
+                for bucket in self._buckets():
+                    bucket.slow_down()
+            elif status < 400:
+                for bucket in self._buckets():
+                    bucket.recover()
+
+    def _observe_error(self, error: Exception):
+        # SDK and requests errors carry the failed response
+        response = getattr(error, "response", None)
+        status = getattr(response, "status_code", None)
+        if status is not None:
+            self.observe(response.headers, status)
+
+    @contextmanager
+    def limit(self, tokens: int = 0, priority: int = INTERACTIVE):
+        """
+        Acquire before the block, a failed response raised inside it is observed
+
+        @return: Slot for reporting the response headers and token usage
+        """
+        waited = self.acquire(tokens, priority)
+        try:
+            yield Slot(self, tokens, waited)
+        except Exception as e:
+            self._observe_error(e)
+            raise
+
+    @asynccontextmanager
+    async def limit_async(self, tokens: int = 0, priority: int = INTERACTIVE):
+        waited = await self.acquire_async(tokens, priority)
+        try:
+            yield Slot(self, tokens, waited)
+        except Exception as e:
+            self._observe_error(e)
+            raise
+
+    def stats(self) -> dict:
+        with self.lock:
+            return {
+                "name": self.name,
+                "acquired": {"interactive": self.acquired[INTERACTIVE], "batch": self.acquired[BATCH]},
+                "waited_seconds": {"interactive": round(self.waited[INTERACTIVE], 3), "batch": round(self.waited[BATCH], 3)},
+                "throttled": self.throttled,
+                "requests_rate_per_minute": round(self.requests.rate * 60, 2) if self.requests else None,
+                "tokens_rate_per_minute": round(self.tokens.rate * 60, 2) if self.tokens else None,
+            }
+
+
+def _env_name(*parts) -> str:
+    return "_".join(re.sub(r"[^A-Z0-9]+", "_", part.upper()).strip("_") for part in parts if part)
+
+
+def limits_from_env(provider: str, model: Optional[str] = None) -> tuple:
+    """
+    Look up (requests per minute, tokens per minute), the model specific variable wins
+
+    @return: Tuple of the two limits
+    """
+    default_requests, default_tokens = DEFAULT_LIMITS.get(provider, (0, 0))
+    limits = []
+    for suffix, default in (("RPM", default_requests), ("TPM", default_tokens)):
+        value = os.environ.get(f"RATE_LIMIT_{_env_name(provider, model, suffix)}") if model else None
+        if not value:
+            value = os.environ.get(f"RATE_LIMIT_{_env_name(provider, suffix)}")
+        # Unset or empty means the default
+        limits.append(float(value) if value else default)
+    return tuple(limits)
+
+
+limiters = {}
+limiters_lock = threading.Lock()
+
+
+def limiter_for(provider: str, model: Optional[str] = None) -> RateLimiter:
+    """
+    Process wide limiter for a provider and model, everything calling the same quota shares it
+
+    @param provider: groq, exa, azure, bing, ...
+    @param model: Model or deployment name, None for providers limited as a whole
+    @return: Shared RateLimiter
+    """
+    key = (provider, model)
+    with limiters_lock:
+        limiter = limiters.get(key)
+        if limiter is None:
+            requests_per_minute, tokens_per_minute = limits_from_env(provider, model)
+            limiter = RateLimiter(requests_per_minute, tokens_per_minute, name=f"{provider}/{model}" if model else provider)
+            limiters[key] = limiter
+        return limiter
+
+
+def limiter_stats() -> list:
+    with limiters_lock:
+        return [limiter.stats() for limiter in limiters.values()]
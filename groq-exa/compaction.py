@@ -0,0 +1,136 @@
+# Shared module, copied into other projects. Edit groq-chat/compaction.py and run: python tools/sync_shared.py
+import math
+import os
+import re
+from collections import Counter
+
+# Limits for the search results handed to the model
+SNIPPET_MAX_CHARS = int(os.getenv("SNIPPET_MAX_CHARS", "1200"))
+SEARCH_OUTPUT_MAX_CHARS = int(os.getenv("SEARCH_OUTPUT_MAX_CHARS", "6000"))
+PASSAGE_WORDS = int(os.getenv("SNIPPET_PASSAGE_WORDS", "60"))
+DUPLICATE_THRESHOLD = float(os.getenv("SNIPPET_DUPLICATE_THRESHOLD", "0.7"))
+
+TOKEN_RE = re.compile(r"[a-z0-9]+")
+STOPWORDS = frozenset("a an and are as at be by for from has have in is it of on or that the this to was were with what which how".split())
+
+
+def tokenize(text: str) -> list:
+    return [token for token in TOKEN_RE.findall(text.lower()) if token not in STOPWORDS]
+
+
+def split_passages(text: str, words: int = PASSAGE_WORDS) -> list:
+    """
+    Split text into passages of about `words` words, overlapping by half
+
+    @param text: Full result text
+    @param words: Words per passage
+    @return: List of (start word index, passage text)
+    """
+    tokens = text.split()
+    if len(tokens) <= words:
+        return [(0, " ".join(tokens))] if tokens else []
+    step = max(1, words // 2)
+    return [(start, " ".join(tokens[start:start + words])) for start in range(0, len(tokens) - step, step)]
+
+
+def bm25_scores(query_terms: list, documents: list, k1: float = 1.5, b: float = 0.75) -> list:
+    """
+    Score tokenized documents against the query with BM25
+
+    @param query_terms: Tokenized query
+    @param documents: List of tokenized documents
+    @return: Score per document
+    """
+    if not documents:
+        return []
+    average_length = sum(len(doc) for doc in documents) / len(documents) or 1
+    document_frequency = Counter(term for doc in documents for term in set(doc))
+    scores = []
+    for doc in documents:
+        counts = Counter(doc)
+        score = 0.0
+        for term in set(query_terms):
+            if term not in counts:
+                continue
+            idf = math.log(1 + (len(documents) - document_frequency[term] + 0.5) / (document_frequency[term] + 0.5))
+            frequency = counts[term]
+            score += idf * frequency * (k1 + 1) / (frequency + k1 * (1 - b + b * len(doc) / average_length))
+        scores.append(score)
+    return scores
+
+
+def shingles(text: str, size: int = 3) -> set:
+    tokens = tokenize(text)
+    # Results without text share nothing, an empty shingle would make them all duplicates
+    if not tokens:
+        return set()
+    return {" ".join(tokens[i:i + size]) for i in range(max(1, len(tokens) - size + 1))}
+
+
+def jaccard(left: set, right: set) -> float:
+    if not left or not right:
+        return 0.0
+    return len(left & right) / len(left | right)
+
+
+def compact_results(query: str, results: list, max_chars: int = SNIPPET_MAX_CHARS, total_chars: int = SEARCH_OUTPUT_MAX_CHARS) -> list:
+    """
+    Cut search results down to the passages most relevant to the query
+
+    Every result's text is split into passages and scored with BM25 against the query
+    across all results. Each result keeps its best matching passages (in reading order)
+    up to max_chars, skipping passages that overlap one already kept, or its opening
+    passage when nothing matches. Near-duplicate results are dropped, and results are
+    kept in relevance order until total_chars is used up.
+
+    @param query: Search query
+    @param results: Result dicts with title, link, snippet, score and publish
+    @param max_chars: Character cap per snippet
+    @param total_chars: Character cap for all snippets together
+    @return: Compacted result dicts
+    """
+    query_terms = tokenize(query)
+    passages = []
+    for index, result in enumerate(results):
+        for start, passage in split_passages(result.get("snippet") or ""):
+            passages.append((index, start, passage))
+    scores = bm25_scores(query_terms, [tokenize(passage) for _, _, passage in passages])
+
+    best = {}
+    for (index, start, passage), score in zip(passages, scores):
+        best.setdefault(index, []).append((score, start, passage))
+
+    compacted = []
+    for index, result in enumerate(results):
+        ranked = sorted(best.get(index, []), key=lambda item: -item[0])
+        # Passages without a query term are filler, the lead passage stands in when nothing matches
+        candidates = [item for item in ranked if item[0] > 0] or [item for item in ranked if item[1] == 0]
+        chosen, used = [], 0
+        for score, start, passage in candidates:
+            # Neighbouring windows share half their words, keep only one of any overlapping pair
+            if any(abs(start - other) < PASSAGE_WORDS for other, _ in chosen):
+                continue
+            if used + len(passage) > max_chars and chosen:
+                continue
+            chosen.append((start, passage[: max_chars - used]))
+            used += len(chosen[-1][1]) + 5
+            if used >= max_chars:
+                break
+        snippet = " ... ".join(passage for _, passage in sorted(chosen))
+        relevance = max((score for score, _, _ in ranked), default=0.0)
+        compacted.append((relevance, index, dict(result, snippet=snippet)))
+
+    kept, kept_shingles, used = [], [], 0
+    for relevance, index, result in sorted(compacted, key=lambda item: (-item[0], item[1])):
+        result_shingles = shingles(result["snippet"])
+        if any(jaccard(result_shingles, other) >= DUPLICATE_THRESHOLD for other in kept_shingles):
+            continue
+        if used + len(result["snippet"]) > total_chars:
+            remaining = total_chars - used
+            if remaining < 200:
+                break
+            result["snippet"] = result["snippet"][:remaining]
+        kept.append(result)
+        kept_shingles.append(result_shingles)
+        used += len(result["snippet"])
+    return kept
@@ -1,21 +1,76 @@
 import os
-import requests
 import json
+import time
+from concurrent.futures import ThreadPoolExecutor
+from functools import lru_cache
 from rich.console import Console
-from groq import Groq
 from dotenv import load_dotenv
-from exa_py import Exa
+from search_cache import SearchCache, cache_from_env
+from completion_cache import CompletionCache, completion_cache_from_env
+from compaction import compact_results, tokenize, jaccard
+from rate_limiter import limiter_for, estimate_tokens
+import tracing
 
 # Initialize Rich
 load_dotenv()
-
-
-# Exa API
-exa = Exa(api_key=os.environ.get("EXA_API_KEY"))
+# Spans go to TRACE_PATH when it's set, see tracing.py
+tracing.configure(service_name="groq-exa")
 
 # Rich Initialize
 console = Console()
 
+
+# Clients and caches are built on first use, importing this module stays cheap and has no side effects.
+# The SDKs are imported inside the factories since they dominate the import time
+@lru_cache(maxsize=None)
+def get_exa():
+    from exa_py import Exa
+
+    return Exa(api_key=os.environ.get("EXA_API_KEY"), base_url=os.environ.get("EXA_BASE_URL", "https://api.exa.ai"))
+
+
+@lru_cache(maxsize=None)
+def get_client():
+    from groq import Groq, DefaultHttpxClient
+
+    # The response hook records every HTTP attempt (retries included) on the current span
+    return Groq(
+        api_key=os.environ.get("GROQ_API_KEY"),
+        http_client=DefaultHttpxClient(event_hooks={"response": [tracing.on_http_response]}),
+    )
+
+
+# Search results are cached on the normalized query plus every search parameter
+@lru_cache(maxsize=None)
+def get_search_cache():
+    return cache_from_env()
+
+
+# Identical requests are answered from the cache without calling Groq, off unless COMPLETION_CACHE is set
+@lru_cache(maxsize=None)
+def get_completion_cache():
+    return completion_cache_from_env()
+
+SEARCH_PARAMS = {
+    "type": "neural",
+    "include_domains": ["arxiv.org", "https://scholar.google.com/"],
+    "start_published_date": "2023-12-31",
+    "end_published_date": "2024-8-05",
+    "use_autoprompt": True,
+    "num_results": 5,
+    "text": True,
+}
+
+# Maximum number of tool calls from a single model turn that run at once
+TOOL_CONCURRENCY = int(os.environ.get("TOOL_CONCURRENCY", "5"))
+
+# Search the raw user query while the first model call is in flight, off unless SPECULATIVE_SEARCH is set
+SPECULATIVE_SEARCH = os.environ.get("SPECULATIVE_SEARCH", "false").lower() in ("1", "true", "yes")
+# Word overlap between the user query and the model's search query needed to reuse the prefetch
+SPECULATIVE_MATCH = float(os.environ.get("SPECULATIVE_MATCH", "0.6"))
+prefetch_executor = ThreadPoolExecutor(max_workers=1, thread_name_prefix="exa-prefetch")
+speculation = {"prefetched": 0, "hits": 0, "misses": 0, "seconds_saved": 0.0}
+
 # Define the search function
 def search(query: str) -> list:
     """
@@ -26,16 +81,20 @@ def search(query: str) -> list:
 
     """
     try:
-        result = exa.search_and_contents(
-            query=query,
-            type="neural",
-            include_domains=["arxiv.org", "https://scholar.google.com/"],
-            start_published_date="2023-12-31",
-            end_published_date="2024-8-05",
-            use_autoprompt=True,
-            num_results=5,
-            text=True,
-        )
+        # The cache holds the raw results, compaction runs on every call so its limits can change
+        search_cache = get_search_cache()
+        cache_key = SearchCache.make_key(query, SEARCH_PARAMS)
+        with tracing.span("cache.lookup", {"cache.name": "search"}) as lookup:
+            cached = search_cache.get(cache_key)
+            lookup.set_attribute("cache.hit", cached is not None)
+        if cached is not None:
+            return compact(query, json.loads(cached), len(cached))
+
+        with tracing.span("exa.search", {"search.query": query}, kind="client") as exa_span:
+            with limiter_for("exa").limit() as slot:
+                exa_span.set_attribute("ratelimit.wait_seconds", slot.waited)
+                result = get_exa().search_and_contents(query=query, **SEARCH_PARAMS)
+            exa_span.set_attribute("search.results", len(result.results))
 
         output = []
 
@@ -49,96 +108,237 @@ def search(query: str) -> list:
                 "publish": item.published_date,
             })
 
-        return json.dumps(output)
+        raw_output = json.dumps(output)
+        search_cache.set(cache_key, raw_output)
+        return compact(query, output, len(raw_output))
     except Exception as e:
         console.print(f"Error during search: {e}", style="bold red")
         return json.dumps({"error": str(e)})
 
 
-client = Groq(
-    api_key=os.environ.get("GROQ_API_KEY"),
-)
+def compact(query: str, results: list, raw_bytes: int) -> str:
+    # Only the passages relevant to the query go to the model
+    with tracing.span("search.compact", {"search.results": len(results), "bytes.in": raw_bytes}) as compact_span:
+        output = json.dumps(compact_results(query, results))
+        compact_span.set_attribute("bytes.out", len(output))
+    return output
+
+
+def create_completion(**settings):
+    """
+    chat.completions.create that answers repeated requests from the completion cache
+    and paces the rest through the shared Groq rate limiter
+
+    @param settings: Keyword arguments for chat.completions.create
+    @return: ChatCompletion, from the cache or from Groq
+    """
+    completion_cache = get_completion_cache()
+    cache_key = None
+    if completion_cache is not None:
+        with tracing.span("cache.lookup", {"cache.name": "completion"}) as lookup:
+            cache_key = CompletionCache.request_key(settings)
+            cached = completion_cache.get(cache_key)
+            lookup.set_attribute("cache.hit", cached is not None)
+        if cached is not None:
+            from groq.types.chat import ChatCompletion
+
+            return ChatCompletion.model_validate_json(cached)
+
+    limiter = limiter_for("groq", settings["model"])
+    estimated = estimate_tokens(settings["messages"], settings.get("max_tokens"))
+    attributes = {
+        "llm.model": settings["model"],
+        "llm.messages": len(settings["messages"]),
+        "llm.max_tokens": settings.get("max_tokens"),
+        "llm.estimated_tokens": estimated,
+    }
+    if tracing.enabled():
+        # Serializing the messages isn't free, only measure it while tracing
+        attributes["bytes.in"] = len(json.dumps(settings["messages"], default=str))
+    with tracing.span("llm.call", attributes, kind="client") as llm_span:
+        with limiter.limit(estimated) as slot:
+            llm_span.set_attribute("ratelimit.wait_seconds", slot.waited)
+            raw = get_client().chat.completions.with_raw_response.create(**settings)
+            response = raw.parse()
+            slot.observe(raw.headers, response.usage.total_tokens if response.usage else None)
+        llm_span.set_attributes(tracing.usage_attributes(response.usage))
+        llm_span.set_attributes({
+            "llm.finish_reason": response.choices[0].finish_reason,
+            "llm.tool_calls": len(response.choices[0].message.tool_calls or []),
+        })
+
+    if cache_key is not None:
+        completion_cache.set(cache_key, response.model_dump_json())
+    return response
+
+def query_similarity(left: str, right: str) -> float:
+    return jaccard(set(tokenize(left or "")), set(tokenize(right or "")))
+
+
+def start_prefetch(query: str) -> dict:
+    """
+    Start searching the user's query on the prefetch thread
+
+    @param query: Raw user query
+    @return: Prefetch handle for match_prefetch and use_prefetch
+    """
+    def timed_search():
+        with tracing.span("search.prefetch", {"search.query": query}):
+            return search(query), time.perf_counter()
+
+    speculation["prefetched"] += 1
+    return {"query": query, "started": time.perf_counter(), "future": prefetch_executor.submit(tracing.propagate(timed_search))}
+
+
+def match_prefetch(prefetch: dict, tool_calls: list):
+    """
+    Pick the search tool call whose query is closest to the prefetched one
+
+    @return: Id of the tool call that can reuse the prefetch, None when none is close enough
+    """
+    best_id, best_score = None, 0.0
+    for tool_call in tool_calls or []:
+        if tool_call.function.name != "search":
+            continue
+        score = query_similarity(prefetch["query"], json.loads(tool_call.function.arguments).get("query"))
+        if score > best_score:
+            best_id, best_score = tool_call.id, score
+    if best_score < SPECULATIVE_MATCH:
+        # Discarded, a search that hasn't started yet is dropped
+        prefetch["future"].cancel()
+        speculation["misses"] += 1
+        return None
+    return best_id
+
+
+def use_prefetch(prefetch: dict):
+    """
+    Wait for the prefetched search and record the time it saved
+
+    @return: Search output, None if the prefetch failed and the search should run normally
+    """
+    needed = time.perf_counter()
+    output, finished = prefetch["future"].result()
+    if output.startswith('{"error"'):
+        speculation["misses"] += 1
+        return None
+    speculation["hits"] += 1
+    # Started now, the same search would have finished `duration` from now instead of at `finished`
+    duration = finished - prefetch["started"]
+    speculation["seconds_saved"] += needed + duration - max(needed, finished)
+    return output
+
 
-# Query the user for a search query
-query = input("Enter a desired query: ")
+def speculation_stats() -> dict:
+    used = speculation["hits"] + speculation["misses"]
+    return dict(speculation, hit_rate=speculation["hits"] / used if used else 0.0)
 
 # Perform a search
 def run_conversation(query):
-    # Initial user message that is passed to the API
-    messages = [{"role": "user", "content": query}]
-
-    # Define the funciton for the model
-    tools = [
-        {
-            "type": "function",
-            "function": {
-                "name": "search",
-                "description": "Search for any query that is not known or understood by the model.",
-                "parameters": {
-                    "type": "object",
-                    "properties": {
-                        "query": {
-                            "type": "string",
-                            "description": "LLM Security encompasses a variety of approaches that should be considered such as OWASP Top 10 LLMs.",
+    # One trace per conversation, model calls, tool calls and cache lookups nest under it
+    with tracing.span("conversation", {"search.speculative": SPECULATIVE_SEARCH}):
+        # Initial user message that is passed to the API
+        messages = [{"role": "user", "content": query}]
+
+        # Overlaps the Exa round trip with the first model call, the model nearly always searches the user's text
+        prefetch = start_prefetch(query) if SPECULATIVE_SEARCH else None
+
+        # Define the funciton for the model
+        tools = [
+            {
+                "type": "function",
+                "function": {
+                    "name": "search",
+                    "description": "Search for any query that is not known or understood by the model.",
+                    "parameters": {
+                        "type": "object",
+                        "properties": {
+                            "query": {
+                                "type": "string",
+                                "description": "LLM Security encompasses a variety of approaches that should be considered such as OWASP Top 10 LLMs.",
+                            },
                         },
+                        "required": ["query"],
                     },
-                    "required": ["query"],
-                },
+                }
             }
-        }
-    ]
-    # First API call: Ask the model to use the function to search for the query
-    chat_completion = client.chat.completions.create(
-        model="llama3-8b-8192",
-        messages=messages,
-        tools=tools,
-        tool_choice="auto",
-        max_tokens=4096,
-    )
+        ]
+        # First API call: Ask the model to use the function to search for the query
+        chat_completion = create_completion(
+            model="llama3-8b-8192",
+            messages=messages,
+            tools=tools,
+            tool_choice="auto",
+            max_tokens=4096,
+        )
     
-    # Process the model response
-    response_message = chat_completion.choices[0].message
-    tool_calls = response_message.tool_calls
-    if tool_calls:
-        available_functions = {
-            "search": search,
-        }
-        messages.append(response_message)
-        for tool_call in tool_calls:
-            function_name = tool_call.function.name
-            function_to_call = available_functions["search"]
-            function_args = json.loads(tool_call.function.arguments)
-            function_response = function_to_call(
-                query=function_args.get("query")
-            )
-            messages.append(
-                {
+        # Process the model response
+        response_message = chat_completion.choices[0].message
+        tool_calls = response_message.tool_calls
+        prefetch_id = match_prefetch(prefetch, tool_calls) if prefetch is not None else None
+        if tool_calls:
+            available_functions = {
+                "search": search,
+            }
+            messages.append(response_message)
+
+            def call_tool(tool_call):
+                function_name = tool_call.function.name
+                function_to_call = available_functions["search"]
+                function_args = json.loads(tool_call.function.arguments)
+                with tracing.span("tool.call", {"tool.name": function_name, "tool.call_id": tool_call.id, "search.query": function_args.get("query")}) as tool_span:
+                    function_response = use_prefetch(prefetch) if tool_call.id == prefetch_id else None
+                    tool_span.set_attribute("search.prefetched", function_response is not None)
+                    if function_response is None:
+                        function_response = function_to_call(
+                            query=function_args.get("query")
+                        )
+                    tool_span.set_attribute("bytes.out", len(function_response))
+                return {
                     "tool_call_id": tool_call.id,
                     "role": "tool",
                     "name": function_name,
                     "content": function_response,
                 }
+
+            # Run the searches concurrently, map keeps the results in tool_call order
+            with ThreadPoolExecutor(max_workers=min(TOOL_CONCURRENCY, len(tool_calls))) as executor:
+                # Pool threads don't inherit the context, propagate keeps the searches under this trace
+                messages.extend(executor.map(tracing.propagate(call_tool), tool_calls))
+            # Print the response
+            console.print("Model's Response (LLM)", style="bold red")
+            console.print(response_message, style="bold red")
+
+            # Second API call: Pass the response to the model
+            final_response = create_completion(
+                model="llama3-8b-8192",
+                messages=messages,
+                max_tokens=4096,
             )
-        # Print the response
-        console.print("Model's Response (LLM)", style="bold red")
-        console.print(response_message, style="bold red")
 
-        # Second API call: Pass the response to the model
-        final_response = client.chat.completions.create(
-            model="llama3-8b-8192",
-            messages=messages,
-            max_tokens=4096,
-        )
+             # Print the final response
+            final = final_response.choices[0].message.content
+
+             # Distinguish the print with a color to understand the function call
+            console.print("Final Response:", final, style="bold blue")
+
+            # Validate the function is called 
+            console.print("Raw Final Response:", final_response, style="bold yellow")
+
+            # Return the final response is needed otherwise you can comment this out
+            # return final
 
-         # Print the final response
-        final = final_response.choices[0].message.content
 
-         # Distinguish the print with a color to understand the function call
-        console.print("Final Response:", final, style="bold blue")
+def main():
+    # Query the user for a search query
+    query = input("Enter a desired query: ")
+    print(run_conversation(query))
+    console.print("Search cache:", get_search_cache().stats(), style="bold green")
+    if get_completion_cache() is not None:
+        console.print("Completion cache:", get_completion_cache().stats(), style="bold green")
+    if SPECULATIVE_SEARCH:
+        console.print("Speculative search:", speculation_stats(), style="bold green")
 
-        # Validate the function is called 
-        console.print("Raw Final Response:", final_response, style="bold yellow")
 
-        # Return the final response is needed otherwise you can comment this out
-        # return final
-print(run_conversation(query))
+if __name__ == "__main__":
+    main()
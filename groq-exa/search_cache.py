@@ -0,0 +1,169 @@
+# Shared module, copied into other projects. Edit groq-chat/search_cache.py and run: python tools/sync_shared.py
+import hashlib
+import json
+import logging
+import os
+import sqlite3
+import threading
+import time
+from collections import OrderedDict
+from typing import Optional
+
+logger = logging.getLogger(__name__)
+
+
+# Two tier cache for Exa search results: an in-memory LRU in front of a SQLite file
+class SearchCache:
+    def __init__(self, path: str = ".search_cache.sqlite", ttl: float = 86400, max_entries: int = 256, max_disk_entries: int = 10000, max_bytes: Optional[int] = None, table: str = "search_cache"):
+        """
+        Create the cache, the disk tier is skipped when path is empty or can't be opened
+
+        @param path: SQLite file used for the on-disk tier
+        @param ttl: Seconds a cached result stays valid
+        @param max_entries: Size of the in-memory LRU tier
+        @param max_disk_entries: Rows kept on disk before the least recently used are evicted
+        @param max_bytes: Optional cap on the bytes of values held by each tier
+        @param table: SQLite table name, lets several caches share one file
+        """
+        self.path = path
+        self.ttl = ttl
+        self.max_entries = max_entries
+        self.max_disk_entries = max_disk_entries
+        self.max_bytes = max_bytes
+        self.table = table
+        self.memory = OrderedDict()
+        self.memory_bytes = 0
+        self.hits = 0
+        self.disk_hits = 0
+        self.misses = 0
+        self.lock = threading.Lock()
+        self.db = None
+        if path:
+            try:
+                self.db = sqlite3.connect(path, check_same_thread=False)
+                self.db.execute(
+                    f"CREATE TABLE IF NOT EXISTS {table} "
+                    "(key TEXT PRIMARY KEY, value TEXT, created REAL, accessed REAL)"
+                )
+                self.db.execute(f"DELETE FROM {table} WHERE created < ?", (time.time() - ttl,))
+                self.db.commit()
+            except sqlite3.Error as e:
+                # An unwritable path (e.g. a read-only working directory) only costs the disk tier
+                logger.warning("Can't open %s, keeping %s in memory only: %s", path, table, e)
+                self.close()
+                self.path = ""
+
+    @staticmethod
+    def make_key(query: str, params: dict) -> str:
+        """
+        Build a cache key from the normalized query and the full search parameters
+
+        @param query: Search query
+        @param params: Parameters passed to search_and_contents
+        @return: Hex digest used as the cache key
+        """
+        normalized = " ".join(query.lower().split())
+        payload = json.dumps({"query": normalized, "params": params}, sort_keys=True, default=str)
+        return hashlib.sha256(payload.encode("utf-8")).hexdigest()
+
+    def get(self, key: str) -> Optional[str]:
+        now = time.time()
+        with self.lock:
+            entry = self.memory.get(key)
+            if entry is not None:
+                value, created = entry
+                if now - created < self.ttl:
+                    self.memory.move_to_end(key)
+                    self.hits += 1
+                    return value
+                self._forget(key)
+
+            if self.db is not None:
+                row = self.db.execute(
+                    f"SELECT value, created FROM {self.table} WHERE key = ?", (key,)
+                ).fetchone()
+                if row is not None:
+                    value, created = row
+                    if now - created < self.ttl:
+                        self.db.execute(f"UPDATE {self.table} SET accessed = ? WHERE key = ?", (now, key))
+                        self.db.commit()
+                        self._remember(key, value, created)
+                        self.hits += 1
+                        self.disk_hits += 1
+                        return value
+                    self.db.execute(f"DELETE FROM {self.table} WHERE key = ?", (key,))
+                    self.db.commit()
+
+            self.misses += 1
+            return None
+
+    def set(self, key: str, value: str):
+        now = time.time()
+        with self.lock:
+            self._remember(key, value, now)
+            if self.db is not None:
+                self.db.execute(
+                    f"INSERT OR REPLACE INTO {self.table} (key, value, created, accessed) VALUES (?, ?, ?, ?)",
+                    (key, value, now, now),
+                )
+                # Evict the least recently used rows once the disk tier is over its limit
+                self.db.execute(
+                    f"DELETE FROM {self.table} WHERE key NOT IN "
+                    f"(SELECT key FROM {self.table} ORDER BY accessed DESC LIMIT ?)",
+                    (self.max_disk_entries,),
+                )
+                if self.max_bytes is not None:
+                    # Keep the most recently used rows whose running size fits in max_bytes
+                    self.db.execute(
+                        f"DELETE FROM {self.table} WHERE key IN (SELECT key FROM "
+                        f"(SELECT key, SUM(LENGTH(value)) OVER (ORDER BY accessed DESC) AS running FROM {self.table}) "
+                        f"WHERE running > ?)",
+                        (self.max_bytes,),
+                    )
+                self.db.commit()
+
+    def _remember(self, key: str, value: str, created: float):
+        self._forget(key)
+        self.memory[key] = (value, created)
+        self.memory_bytes += len(value)
+        while self.memory and (
+            len(self.memory) > self.max_entries
+            or (self.max_bytes is not None and self.memory_bytes > self.max_bytes)
+        ):
+            _, (evicted, _) = self.memory.popitem(last=False)
+            self.memory_bytes -= len(evicted)
+
+    def _forget(self, key: str):
+        entry = self.memory.pop(key, None)
+        if entry is not None:
+            self.memory_bytes -= len(entry[0])
+
+    def stats(self) -> dict:
+        with self.lock:
+            lookups = self.hits + self.misses
+            return {
+                "hits": self.hits,
+                "disk_hits": self.disk_hits,
+                "misses": self.misses,
+                "hit_rate": self.hits / lookups if lookups else 0.0,
+                "memory_entries": len(self.memory),
+                "memory_bytes": self.memory_bytes,
+            }
+
+    def close(self):
+        if self.db is not None:
+            self.db.close()
+            self.db = None
+
+
+def cache_from_env() -> SearchCache:
+    """
+    Build a SearchCache from SEARCH_CACHE_PATH, SEARCH_CACHE_TTL and SEARCH_CACHE_SIZE
+
+    @return: Configured SearchCache
+    """
+    return SearchCache(
+        path=os.environ.get("SEARCH_CACHE_PATH", ".search_cache.sqlite"),
+        ttl=float(os.environ.get("SEARCH_CACHE_TTL", "86400")),
+        max_entries=int(os.environ.get("SEARCH_CACHE_SIZE", "256")),
+    )
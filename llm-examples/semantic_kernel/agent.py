@@ -1,17 +1,27 @@
 ## Initialize the environment client.
-from semantic_kernel.agents import AzureAIAgent, AzureAIAgentThread
 from semantic_kernel.functions import kernel_function
 from semantic_kernel import Kernel
-from azure.identity import DefaultAzureCredential
 from dotenv import load_dotenv
-from azure.ai.projects import AIProjectClient
 import os
+import argparse
+import csv
 import requests
 import json
+import threading
+import time
+from collections import OrderedDict
+from functools import lru_cache
+from requests.adapters import HTTPAdapter
+from urllib3.util.retry import Retry
 from typing import Any, Callable, Set, Dict, List, Optional
 import asyncio
+from pipeline import run_pipeline
+from rate_limiter import limiter_for, estimate_tokens, retry_after, INTERACTIVE, BATCH
+import tracing
 
 load_dotenv()
+# Spans go to TRACE_PATH when it's set, see tracing.py
+tracing.configure(service_name="semantic-kernel")
 
 # Environment Example - Custom for your perspective can change
 connection = os.environ.get("AZURE_AI_AGENT_PROJECT_CONNECTION_STRING") # Azure AI Foundry connection string
@@ -21,41 +31,115 @@ writer_agent = os.environ.get("WRITER_AGENT_ID") # Created agent in Azure AI Fou
 bing_search_subscription_key = os.environ.get("BING_SEARCH_SUBSCRIPTION_KEY") # Bing Search API key
 bing_search_url = os.environ.get("BING_SEARCH_URL") # Bing Search API URL
 
-# Define build client initialization
-project_client = AIProjectClient.from_connection_string(
-    credential=DefaultAzureCredential(), conn_str=connection
-)
+# Credentials, clients and the funds list are built on first use, importing this module
+# doesn't touch Azure or the filesystem. semantic_kernel.agents loads the Azure AI SDK when
+# its agents are imported, so they are imported where an agent or client is built. The
+# credential is resolved once per process
+@lru_cache(maxsize=None)
+def get_credential():
+    from azure.identity import DefaultAzureCredential
+
+    return DefaultAzureCredential()
+
+
+# Bing responses retried by SearchPlugin.search
+RETRY_STATUSES = (429, 500, 502, 503, 504)
 
 ## Define our search function
 class SearchPlugin:
-    def __init__(self, bing_search_subscription_key, bing_search_url):
+    def __init__(self, bing_search_subscription_key, bing_search_url, cache_ttl=3600, cache_size=512, timeout=10, max_retries=3, backoff=0.5):
         self.bing_search_subscription_key = bing_search_subscription_key
         self.bing_search_url = bing_search_url
+        self.timeout = timeout
+        self.max_retries = max_retries
+        self.backoff = backoff
+        self.cache_ttl = cache_ttl
+        self.cache_size = cache_size
+        # query -> (expires_at, results) shared by every agent using this plugin
+        self.cache = OrderedDict()
+        self.cache_lock = threading.Lock()
+
+        # Pooled keep-alive session. Only connection errors are retried here, inside the worker thread,
+        # throttled and failed responses are retried by search without blocking the event loop
+        retry = Retry(
+            total=max_retries,
+            backoff_factor=backoff,
+            status=0,
+            allowed_methods=frozenset(["GET"]),
+            respect_retry_after_header=False,
+        )
+        adapter = HTTPAdapter(pool_connections=4, pool_maxsize=16, max_retries=retry)
+        self.session = requests.Session()
+        self.session.mount("https://", adapter)
+        self.session.mount("http://", adapter)
+        self.session.headers.update({"Ocp-Apim-Subscription-Key": bing_search_subscription_key})
     @kernel_function(
             description = "Performs a Bing search against the given query",
             name = "search",
     )
 
-    def search(self, query: str) -> list:
+    async def search(self, query: str) -> list:
         """
         Perform a bing search against the given query
 
+        The request runs in a worker thread and retries wait with asyncio.sleep, semantic
+        kernel calls kernel functions on the event loop the other agents share
+
         @param query: Search query
         @return: List of search results
 
         """
-        headers = {"Ocp-Apim-Subscription-Key": bing_search_subscription_key}
-        params = {"q": query, "textDecorations": False}
-        response = requests.get(bing_search_url, headers=headers, params=params)
-        response.raise_for_status()
-        search_results = response.json()
-
-        output = []
-
-        for result in search_results["webPages"]["value"]:
-            output.append({"title": result["name"], "link": result["url"], "snippet": result["snippet"]})
-
-        return json.dumps(output)
+        with tracing.span("tool.call", {"tool.name": "search", "search.query": query}) as tool_span:
+            key = " ".join(query.lower().split())
+            now = time.monotonic()
+            with self.cache_lock:
+                cached = self.cache.get(key)
+                hit = cached is not None and cached[0] > now
+                if hit:
+                    self.cache.move_to_end(key)
+            tool_span.set_attribute("cache.hit", hit)
+            if hit:
+                return cached[1]
+
+            params = {"q": query, "textDecorations": False}
+            with tracing.span("bing.search", {"search.query": query}, kind="client") as bing_span:
+                waited = 0.0
+                for attempt in range(self.max_retries + 1):
+                    async with limiter_for("bing").limit_async() as slot:
+                        waited += slot.waited
+                        response = await asyncio.to_thread(
+                            self.session.get, self.bing_search_url, params=params, timeout=self.timeout
+                        )
+                        slot.observe(response.headers, status=response.status_code)
+                    if response.status_code not in RETRY_STATUSES or attempt == self.max_retries:
+                        break
+                    # Honour Retry-After, otherwise back off exponentially
+                    await asyncio.sleep(retry_after(response.headers) or self.backoff * 2 ** attempt)
+                bing_span.set_attributes({
+                    "ratelimit.wait_seconds": waited,
+                    "http.retries": attempt,
+                    "http.status_code": response.status_code,
+                    "bytes.in": len(response.content),
+                })
+                response.raise_for_status()
+            search_results = response.json()
+
+            output = []
+
+            for result in search_results["webPages"]["value"]:
+                output.append({"title": result["name"], "link": result["url"], "snippet": result["snippet"]})
+
+            output = json.dumps(output)
+            tool_span.set_attribute("bytes.out", len(output))
+            with self.cache_lock:
+                self.cache[key] = (now + self.cache_ttl, output)
+                self.cache.move_to_end(key)
+                while len(self.cache) > self.cache_size:
+                    self.cache.popitem(last=False)
+            return output
+
+    def close(self):
+        self.session.close()
 ## --- Search Function --- ##
 
 
@@ -72,29 +156,38 @@ def load_funds(file_path: str) -> list:
     return funds
 
 funds_file_path = "funds.txt"
-funds = load_funds(funds_file_path)
-print(f"Loaded funds: {funds}")
 
-# Clean the format funds as string
-# Convert the list of funds into a comma-separated string
-funds_string = ", ".join(funds)
-print(f"Funds string: {funds_string}")
+
+@lru_cache(maxsize=None)
+def get_funds_string() -> str:
+    funds = load_funds(funds_file_path)
+    print(f"Loaded funds: {funds}")
+
+    # Clean the format funds as string
+    # Convert the list of funds into a comma-separated string
+    funds_string = ", ".join(funds)
+    print(f"Funds string: {funds_string}")
+    return funds_string
 
 # Define our prompt to run against the agent with dynamic portfolio parameters
-age = 25
-risk_tolerance = "medium 7/10"
-time_range = "25 years"
-us_equity_allocation = 65
-intl_equity_allocation = 35
+DEFAULT_PROFILE = {
+    "age": 25,
+    "risk_tolerance": "medium 7/10",
+    "time_range": "25 years",
+    "us_equity_allocation": 65,
+    "intl_equity_allocation": 35,
+}
+
 
-portfolio_prompt = f"""
-I'm {age} years old with a {risk_tolerance} risk tolerance. I want to create a balanced portfolio 
-with approximately {us_equity_allocation}% US equities and {intl_equity_allocation}% International Equity with a time horizon of {time_range}.
+def build_portfolio_prompt(profile: dict) -> str:
+    return f"""
+I'm {profile['age']} years old with a {profile['risk_tolerance']} risk tolerance. I want to create a balanced portfolio 
+with approximately {profile['us_equity_allocation']}% US equities and {profile['intl_equity_allocation']}% International Equity with a time horizon of {profile['time_range']}.
 
 Based on the following list of available funds, please recommend a specific allocation that 
 meets my investment goals:
 
-Available funds: {funds_string}
+Available funds: {get_funds_string()}
 
 For each recommended fund:
 1. Provide the allocation percentage
@@ -102,71 +195,16 @@ For each recommended fund:
 3. Describe its role in the overall portfolio strategy
 """
 
-# Create a client to connect to the Azure OpenAI service
-credential = DefaultAzureCredential()
-client = AzureAIAgent.create_client(credential=credential, conn_str=connection)
 
-async def main():
-    async with client:
-    # Create a kernel
-        kernel = Kernel()
-
-        # Create the search plugin to add to kernel
-        search_plugin = SearchPlugin(bing_search_subscription_key, bing_search_url)
-        kernel.add_plugin(plugin=search_plugin, plugin_name="search")
-
-        # Establish our existing agent by going to portal retrieve the assistant id or agent id
-        finance_definition = await client.agents.get_agent(agent_id=finance_agent)
-
-        advisor_agent = AzureAIAgent(client=client, definition=finance_definition, kernel=kernel)
-        
-        
-        # Use the agent to run a prompt and get a response
-        editor_definition = await client.agents.get_agent(agent_id=editor_agent)
-        editing_agent = AzureAIAgent(client=client, definition=editor_definition, kernel=kernel)
-
-
-        # Writer Agent that is defined also leveraged for final step
-        writer_definition = await client.agents.get_agent(agent_id=writer_agent)
-        writing_agent = AzureAIAgent(client=client, definition=writer_definition, kernel=kernel)
-
-        # Define our prompt to run against the agent
-        ##prompt = "What is the best method of evasion for ML models?, I'm looking for tactics of evasion that are effective against ML models."
-
-        # Create threads for three agents
-        advisor_thread = AzureAIAgentThread(client=client)
-        editor_thread = AzureAIAgentThread(client=client)
-        writer_thread = AzureAIAgentThread(client=client)
-
-        # try to run the agent and research threads concurrently
-        try:
-            # Get response from first agent
-            print(f"\n--- Response from {advisor_agent.name} ---")
-            agent_response = await advisor_agent.get_response(messages=[portfolio_prompt], thread=advisor_thread)
-
-            # Debug to check the structure of the response
-            print(f"Response type: {type(agent_response)}")
-            print(f"Content type: {(agent_response.message.content)}")
-
-            # Extract the text content safely based on the actual structure
-            if isinstance(agent_response.message.content, list):
-                if isinstance(agent_response.message.content[0], str):
-                    first_agent_text = agent_response.message.content[0]
-                elif hasattr(agent_response.message.content[0], 'text'):
-                    first_agent_text = agent_response.message.content[0].text
-                else:
-                    first_agent_text = str(agent_response.message.content[0])
-            else:
-                first_agent_text = str(agent_response.message.content)
-            
-            # Create a new prompt for the research agent that includes the first agent's response
-            editor_prompt = f"""
+def build_editor_prompt(profile: dict, first_agent_text: str) -> str:
+    # Create a new prompt for the research agent that includes the first agent's response
+    return f"""
             I received the following investment portfolio recommendation from a financial advisor:
 
             {first_agent_text}
 
-            Please review this portfolio recommendation for a {age}-year-old investor with {risk_tolerance} risk tolerance 
-            aiming for {us_equity_allocation}% US equities and {intl_equity_allocation}% International Equity.
+            Please review this portfolio recommendation for a {profile['age']}-year-old investor with {profile['risk_tolerance']} risk tolerance 
+            aiming for {profile['us_equity_allocation']}% US equities and {profile['intl_equity_allocation']}% International Equity.
 
             Please analyze:
             1. The appropriateness of fund selection and allocation percentages
@@ -177,24 +215,10 @@ async def main():
             Provide clear, actionable feedback that would improve this recommendation.
             """
 
-            # Get response from research agent
-            print(f"\n--- Response from {editor_definition.name} --- based on Financial Advisor's output")
-            research_response = await editing_agent.get_response(messages=[editor_prompt], thread=editor_thread)
-            # Extract the research text safely
-            if isinstance(research_response.message.content, list):
-                if isinstance(research_response.message.content[0], str):
-                    research_text = research_response.message.content[0]
-                elif hasattr(research_response.message.content[0], 'text'):
-                    research_text = research_response.message.content[0].text
-                else:
-                    research_text = str(research_response.message.content[0])
-            else:
-                research_text = str(research_response.message.content)
-                
-            print(research_text)
 
-            # Optional: Ask a follow-up question that combines both insights
-            combined_insights = f"""
+def build_writer_messages(profile: dict, first_agent_text: str, research_text: str) -> list:
+    # Optional: Ask a follow-up question that combines both insights
+    combined_insights = f"""
             Initial Portfolio Recommendation from Financial Advisor:
             {first_agent_text}
 
@@ -202,9 +226,9 @@ async def main():
             {research_text}
             """
 
-            FOLLOW_UP = f"""
-            Based on both the initial recommendation and expert analysis, create a comprehensive investment plan for a {age}-year-old 
-            investor with {risk_tolerance} risk tolerance targeting {us_equity_allocation}% US equities and {intl_equity_allocation}% International Equity.
+    FOLLOW_UP = f"""
+            Based on both the initial recommendation and expert analysis, create a comprehensive investment plan for a {profile['age']}-year-old 
+            investor with {profile['risk_tolerance']} risk tolerance targeting {profile['us_equity_allocation']}% US equities and {profile['intl_equity_allocation']}% International Equity.
 
             Your response should be formatted as a professional investment report with:
             1. Executive Summary
@@ -216,34 +240,248 @@ async def main():
 
             Present this in a clear, client-ready format with appropriate sections and formatting.
             """
-            # Send follow-up to the first agent with both response
-            
-            # Send follow-up to the first agent with both responses
-            print(f"\n--- Final Investment Report from {writer_definition.name} ---")
-            agent_followup = await writing_agent.get_response(
-                messages=[combined_insights, FOLLOW_UP], 
-                thread=writer_thread
+    return [combined_insights, FOLLOW_UP]
+
+
+# Create a client to connect to the Azure OpenAI service
+@lru_cache(maxsize=None)
+def get_client():
+    from semantic_kernel.agents import AzureAIAgent
+
+    return AzureAIAgent.create_client(credential=get_credential(), conn_str=connection)
+
+def response_text(response) -> str:
+    """
+    Extract the text content safely based on the actual structure of an agent response
+
+    @param response: Response returned by AzureAIAgent.get_response
+    @return: Text of the response
+    """
+    if isinstance(response.message.content, list):
+        if isinstance(response.message.content[0], str):
+            return response.message.content[0]
+        elif hasattr(response.message.content[0], 'text'):
+            return response.message.content[0].text
+        else:
+            return str(response.message.content[0])
+    return str(response.message.content)
+
+
+async def limited_response(agent, messages: list, thread, priority: int = INTERACTIVE):
+    """
+    agent.get_response paced by the shared limiter of the model deployment behind the agent
+
+    @param agent: AzureAIAgent to run
+    @param messages: Messages for this turn
+    @param thread: Thread the agent runs on
+    @param priority: INTERACTIVE for a single run, BATCH for run_batch
+    @return: Agent response
+    """
+    limiter = limiter_for("azure", agent.definition.model)
+    estimated = estimate_tokens(messages)
+    attributes = {
+        "agent.name": agent.name,
+        "llm.model": agent.definition.model,
+        "llm.estimated_tokens": estimated,
+        "ratelimit.priority": priority,
+    }
+    # Search calls the agent makes while answering nest under this span
+    with tracing.span("agent.run", attributes, kind="client") as agent_span:
+        agent_span.set_attribute("ratelimit.wait_seconds", await limiter.acquire_async(estimated, priority))
+        response = await agent.get_response(messages=messages, thread=thread)
+        if tracing.enabled():
+            agent_span.set_attribute("bytes.out", len(response_text(response)))
+        return response
+
+
+async def main():
+    from semantic_kernel.agents import AzureAIAgent, AzureAIAgentThread
+
+    client = get_client()
+    portfolio_prompt = build_portfolio_prompt(DEFAULT_PROFILE)
+    async with client:
+    # Create a kernel
+        kernel = Kernel()
+
+        # Create the search plugin to add to kernel
+        search_plugin = SearchPlugin(bing_search_subscription_key, bing_search_url)
+        kernel.add_plugin(plugin=search_plugin, plugin_name="search")
+
+        # Create threads for three agents
+        advisor_thread = AzureAIAgentThread(client=client)
+        editor_thread = AzureAIAgentThread(client=client)
+        writer_thread = AzureAIAgentThread(client=client)
+
+        async def advisor_step(results):
+            # Get response from first agent
+            advisor_agent = AzureAIAgent(client=client, definition=results["finance_definition"], kernel=kernel)
+            print(f"\n--- Response from {advisor_agent.name} ---")
+            agent_response = await limited_response(advisor_agent, [portfolio_prompt], advisor_thread)
+
+            # Debug to check the structure of the response
+            print(f"Response type: {type(agent_response)}")
+            print(f"Content type: {(agent_response.message.content)}")
+            return response_text(agent_response)
+
+        async def editor_step(results):
+            editing_agent = AzureAIAgent(client=client, definition=results["editor_definition"], kernel=kernel)
+            editor_prompt = build_editor_prompt(DEFAULT_PROFILE, results["advisor"])
+
+            # Get response from research agent
+            print(f"\n--- Response from {results['editor_definition'].name} --- based on Financial Advisor's output")
+            research_response = await limited_response(editing_agent, [editor_prompt], editor_thread)
+            research_text = response_text(research_response)
+            print(research_text)
+            return research_text
+
+        async def writer_step(results):
+            writing_agent = AzureAIAgent(client=client, definition=results["writer_definition"], kernel=kernel)
+
+            # Send follow-up to the writer agent with both responses
+            print(f"\n--- Final Investment Report from {results['writer_definition'].name} ---")
+            agent_followup = await limited_response(
+                writing_agent,
+                build_writer_messages(DEFAULT_PROFILE, results["advisor"], results["editor"]),
+                writer_thread,
             )
-            # Extract the follow-up text safely
-            if isinstance(agent_followup.message.content, list):
-                if isinstance(agent_followup.message.content[0], str):
-                    followup_text = agent_followup.message.content[0]
-                elif hasattr(agent_followup.message.content[0], 'text'):
-                    followup_text = agent_followup.message.content[0].text
-                else:
-                    followup_text = str(agent_followup.message.content[0])
-            else:
-                followup_text = str(agent_followup.message.content)
-                
+            followup_text = response_text(agent_followup)
             print(followup_text)
+            return followup_text
+
+        # Agent lookups and thread creation don't depend on each other so they overlap,
+        # each agent step starts as soon as its own definition, thread and input are ready
+        steps = {
+            "finance_definition": ((), lambda results: client.agents.get_agent(agent_id=finance_agent)),
+            "editor_definition": ((), lambda results: client.agents.get_agent(agent_id=editor_agent)),
+            "writer_definition": ((), lambda results: client.agents.get_agent(agent_id=writer_agent)),
+            "advisor_thread": ((), lambda results: advisor_thread.create()),
+            "editor_thread": ((), lambda results: editor_thread.create()),
+            "writer_thread": ((), lambda results: writer_thread.create()),
+            "advisor": (("finance_definition", "advisor_thread"), advisor_step),
+            "editor": (("editor_definition", "editor_thread", "advisor"), editor_step),
+            "writer": (("writer_definition", "writer_thread", "editor"), writer_step),
+        }
+
+        # try to run the agent and research threads concurrently
+        try:
+            # One trace for the whole advisor -> editor -> writer run
+            with tracing.span("pipeline", {"pipeline.steps": len(steps)}):
+                await run_pipeline(steps)
         finally:
-            # Clean up threads
-            if advisor_thread:
-                await advisor_thread.delete()
-            if editor_thread:
-                await editor_thread.delete()
-            if writer_thread:
-                await writer_thread.delete()
+            # Clean up threads concurrently
+            await asyncio.gather(
+                advisor_thread.delete(),
+                editor_thread.delete(),
+                writer_thread.delete(),
+                return_exceptions=True,
+            )
+
+
+def load_profiles(file_path: str) -> list:
+    """
+    Load investor profiles from a JSONL or CSV file
+
+    Each profile needs the same fields as DEFAULT_PROFILE, an optional `id` is
+    carried through to the output.
+
+    @param file_path: Path to a .jsonl or .csv file
+    @return: List of profile dicts
+    """
+    with open(file_path, 'r', newline='') as file:
+        if file_path.endswith(".csv"):
+            profiles = list(csv.DictReader(file))
+        else:
+            profiles = [json.loads(line) for line in file if line.strip()]
+    for index, profile in enumerate(profiles):
+        # 0 is a valid allocation, only absent or blank fields are missing
+        missing = [field for field in DEFAULT_PROFILE if field not in profile or profile[field] in (None, "")]
+        if missing:
+            raise ValueError(f"Profile {index} is missing {', '.join(missing)}")
+        profile.setdefault("id", str(index))
+    return profiles
+
+
+async def run_batch(profiles_path: str, output_path: str, concurrency: int = 4):
+    """
+    Run the advisor -> editor -> writer chain for every profile in a file
+
+    Each stage has its own concurrency limit, so profiles are pipelined: while one
+    profile is with the editor the next one can already be with the advisor. Results
+    are appended to the output JSONL file as each profile finishes.
+
+    @param profiles_path: JSONL or CSV file of investor profiles
+    @param output_path: JSONL file the reports are appended to
+    @param concurrency: Maximum concurrent requests per stage
+    """
+    profiles = load_profiles(profiles_path)
+    print(f"Loaded {len(profiles)} profiles from {profiles_path}")
+
+    from semantic_kernel.agents import AzureAIAgent, AzureAIAgentThread
+
+    client = get_client()
+    async with client:
+        kernel = Kernel()
+        search_plugin = SearchPlugin(bing_search_subscription_key, bing_search_url)
+        kernel.add_plugin(plugin=search_plugin, plugin_name="search")
+
+        finance_definition, editor_definition, writer_definition = await asyncio.gather(
+            client.agents.get_agent(agent_id=finance_agent),
+            client.agents.get_agent(agent_id=editor_agent),
+            client.agents.get_agent(agent_id=writer_agent),
+        )
+        advisor_agent = AzureAIAgent(client=client, definition=finance_definition, kernel=kernel)
+        editing_agent = AzureAIAgent(client=client, definition=editor_definition, kernel=kernel)
+        writing_agent = AzureAIAgent(client=client, definition=writer_definition, kernel=kernel)
+
+        stage_limits = {stage: asyncio.Semaphore(concurrency) for stage in ("advisor", "editor", "writer")}
+        # Bound the profiles in flight so threads aren't created for the whole book at once
+        in_flight = asyncio.Semaphore(concurrency * 3)
+
+        async def run_stage(stage, agent, messages, thread):
+            # Batch profiles use the batch lane so an interactive run on the same deployment goes first
+            async with stage_limits[stage]:
+                return response_text(await limited_response(agent, messages, thread, BATCH))
+
+        async def run_profile(profile, output):
+            async with in_flight:
+                # One trace per profile, its three stages nest under it
+                with tracing.span("profile", {"profile.id": profile["id"]}) as profile_span:
+                    threads = [AzureAIAgentThread(client=client) for _ in range(3)]
+                    record = {"id": profile["id"], "profile": profile}
+                    try:
+                        advisor_text = await run_stage("advisor", advisor_agent, [build_portfolio_prompt(profile)], threads[0])
+                        editor_text = await run_stage("editor", editing_agent, [build_editor_prompt(profile, advisor_text)], threads[1])
+                        report = await run_stage(
+                            "writer", writing_agent, build_writer_messages(profile, advisor_text, editor_text), threads[2]
+                        )
+                        record.update({"advisor": advisor_text, "editor": editor_text, "report": report})
+                        print(f"Finished profile {profile['id']}")
+                    except Exception as e:
+                        record["error"] = str(e)
+                        profile_span.record_error(e)
+                        print(f"Profile {profile['id']} failed: {e}")
+                    finally:
+                        await asyncio.gather(*(thread.delete() for thread in threads), return_exceptions=True)
+                output.write(json.dumps(record) + "\n")
+                output.flush()
+
+        with open(output_path, "a") as output:
+            await asyncio.gather(*(run_profile(profile, output) for profile in profiles))
+
+
+def cli():
+    parser = argparse.ArgumentParser(description="Portfolio advisor -> editor -> writer agents")
+    parser.add_argument("--profiles", help="JSONL or CSV file of investor profiles to run in batch")
+    parser.add_argument("--output", default="reports.jsonl", help="JSONL file batch reports are appended to")
+    parser.add_argument("--concurrency", type=int, default=4, help="Concurrent requests per agent stage")
+    args = parser.parse_args()
+
+    # Run the main function
+    if args.profiles:
+        asyncio.run(run_batch(args.profiles, args.output, args.concurrency))
+    else:
+        asyncio.run(main())
+
+
 if __name__ == "__main__":
-    asyncio.run(main())
-    # Run the main function
\ No newline at end of file
+    cli()
\ No newline at end of file
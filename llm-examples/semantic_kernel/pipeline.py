@@ -0,0 +1,65 @@
+import asyncio
+from typing import Any, Awaitable, Callable, Dict, Iterable, Tuple
+
+import tracing
+
+
+# A step is (names of the steps it depends on, async function taking the results so far)
+Step = Tuple[Iterable[str], Callable[[Dict[str, Any]], Awaitable[Any]]]
+
+
+def check_pipeline(steps: Dict[str, Step]):
+    """
+    Make sure every dependency exists and the steps form a DAG
+
+    @param steps: Mapping of step name to (dependencies, function)
+    """
+    visiting, done = set(), set()
+
+    def visit(name, path):
+        if name in done:
+            return
+        if name in visiting:
+            raise ValueError(f"Pipeline has a cycle: {' -> '.join(path + [name])}")
+        if name not in steps:
+            raise ValueError(f"Unknown pipeline step: {name}")
+        visiting.add(name)
+        for dependency in steps[name][0]:
+            visit(dependency, path + [name])
+        visiting.discard(name)
+        done.add(name)
+
+    for name in steps:
+        visit(name, [])
+
+
+async def run_pipeline(steps: Dict[str, Step]) -> Dict[str, Any]:
+    """
+    Run the steps, starting each one as soon as its dependencies have finished
+
+    Steps that don't depend on each other run concurrently. If any step fails the
+    remaining steps are cancelled and the error is raised.
+
+    @param steps: Mapping of step name to (dependencies, function)
+    @return: Mapping of step name to the value its function returned
+    """
+    check_pipeline(steps)
+    results: Dict[str, Any] = {}
+    tasks: Dict[str, asyncio.Task] = {}
+
+    async def run_step(name):
+        dependencies, function = steps[name]
+        await asyncio.gather(*(tasks[dependency] for dependency in dependencies))
+        # Timed from when the dependencies are done, the wait for them isn't part of the step
+        with tracing.span("pipeline.step", {"pipeline.step": name}):
+            results[name] = await function(results)
+
+    for name in steps:
+        tasks[name] = asyncio.create_task(run_step(name))
+
+    try:
+        await asyncio.gather(*tasks.values())
+    finally:
+        for task in tasks.values():
+            task.cancel()
+    return results
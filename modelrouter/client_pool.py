@@ -0,0 +1,112 @@
+import os
+import re
+import threading
+import httpx
+from openai import AzureOpenAI, AsyncAzureOpenAI
+from telemetry import on_response, on_response_async
+from rate_limiter import limiter_for
+from tracing import on_http_response, on_http_response_async
+
+
+# Connection pool settings shared by every client built from the registry
+pool_size = int(os.environ.get("ROUTER_POOL_SIZE", "20"))
+keepalive_expiry = float(os.environ.get("ROUTER_KEEPALIVE", "30"))
+
+
+def pool_limits():
+    return httpx.Limits(
+        max_connections=pool_size,
+        max_keepalive_connections=pool_size,
+        keepalive_expiry=keepalive_expiry,
+    )
+
+
+# Process wide registry so agents on the same endpoint share one client and connection pool
+class ClientRegistry:
+    def __init__(self, factory):
+        """
+        @param factory: Callable (endpoint, api_version, api_key) -> client
+        """
+        self.factory = factory
+        self.clients = {}
+        self.refcounts = {}
+        self.lock = threading.Lock()
+
+    def acquire(self, endpoint, api_version, api_key):
+        """
+        Return the shared client for this endpoint, creating it on first use
+
+        @param endpoint: Azure OpenAI endpoint
+        @param api_version: API version
+        @param api_key: API key
+        @return: Shared client
+        """
+        key = (endpoint, api_version, api_key)
+        with self.lock:
+            client = self.clients.get(key)
+            if client is None:
+                client = self.factory(endpoint, api_version, api_key)
+                self.clients[key] = client
+                self.refcounts[key] = 0
+            self.refcounts[key] += 1
+            return client
+
+    def release(self, client):
+        """
+        Drop one reference to a client
+
+        @param client: Client previously returned by acquire
+        @return: True when this was the last reference and the caller should close it
+        """
+        with self.lock:
+            for key, shared in self.clients.items():
+                if shared is client:
+                    self.refcounts[key] -= 1
+                    if self.refcounts[key] == 0:
+                        del self.clients[key]
+                        del self.refcounts[key]
+                        return True
+                    return False
+        return False
+
+
+DEPLOYMENT_RE = re.compile(r"/deployments/([^/]+)/")
+
+
+def deployment_limiter(response):
+    # The deployment in the request path names the quota, it matches the model passed to create()
+    match = DEPLOYMENT_RE.search(response.request.url.path)
+    return limiter_for("azure", match.group(1) if match else None)
+
+
+def on_rate_limit(response):
+    # Every response, including the SDK's own retries, updates the shared limiter
+    deployment_limiter(response).observe(response.headers, response.status_code)
+
+
+async def on_rate_limit_async(response):
+    on_rate_limit(response)
+
+
+def build_client(endpoint, api_version, api_key):
+    return AzureOpenAI(
+        api_version=api_version,
+        azure_endpoint=endpoint,
+        api_key=api_key,
+        http_client=httpx.Client(limits=pool_limits(), event_hooks={"response": [on_response, on_rate_limit, on_http_response]}),
+    )
+
+
+def build_async_client(endpoint, api_version, api_key):
+    # Retries are handled by the caller so 429s can honour retry-after with jitter
+    return AsyncAzureOpenAI(
+        api_version=api_version,
+        azure_endpoint=endpoint,
+        api_key=api_key,
+        max_retries=0,
+        http_client=httpx.AsyncClient(limits=pool_limits(), event_hooks={"response": [on_response_async, on_rate_limit_async, on_http_response_async]}),
+    )
+
+
+registry = ClientRegistry(build_client)
+async_registry = ClientRegistry(build_async_client)
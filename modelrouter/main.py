@@ -1,10 +1,18 @@
 import os
-from openai import AzureOpenAI
+import asyncio
+import random
 from dotenv import load_dotenv
+from openai import RateLimitError
+from client_pool import registry, async_registry
+from telemetry import telemetry, start_timing, mark_first_byte, finish_timing
+from rate_limiter import limiter_for, estimate_tokens, INTERACTIVE, BATCH
+import tracing
 
 
 # Load environment variables from .env file
 load_dotenv()
+# Spans go to TRACE_PATH when it's set, see tracing.py
+tracing.configure(service_name="modelrouter")
 
 endpoint = os.environ.get('AZURE_ENDPOINT')
 api_key = os.environ.get('AZURE_OPENAI_API_KEY')
@@ -18,16 +26,16 @@ class ModelRouterAgent:
         self.api_key = api_key
         self.deployment_name = deployment_name
         self.api_version = api_version
-        self.client = AzureOpenAI(
-            api_version=self.api_version,
-            azure_endpoint=self.endpoint,
-            api_key=self.api_key,
-        )
+        # Agents on the same endpoint share one pooled client
+        self.client = registry.acquire(self.endpoint, self.api_version, self.api_key)
+        # Shared with every agent on this deployment, fed by the response hooks in client_pool
+        self.limiter = limiter_for("azure", self.deployment_name)
         self.system_prompt = system_prompt
-    # Define a method to send a message to the model
-    def run(self, user_prompt):
-        response = self.client.chat.completions.create(
-            #stream=True, # Enable streaming responses this won't allow model router to display the model
+        # Model picked by the router for the latest run_stream call
+        self.routed_model = None
+    # Build the request shared by run and run_stream
+    def _request(self, user_prompt):
+        return dict(
             messages=[
                 {"role": "system", "content": self.system_prompt},
                 {"role": "user", "content": user_prompt},
@@ -39,17 +47,242 @@ class ModelRouterAgent:
             presence_penalty=0.0,
             model=self.deployment_name,
         )
+    # Estimated tokens for the shared limiter, settled against the real usage afterwards
+    def _estimate(self, request):
+        return estimate_tokens(request["messages"], request["max_tokens"])
+    def _settle(self, estimated, usage):
+        if usage is not None:
+            self.limiter.settle(estimated, usage.total_tokens)
+    # Attributes every llm.call span starts with, the routed model and usage are added once known
+    def _span_attributes(self, request, estimated, stream):
+        return {
+            "llm.deployment": self.deployment_name,
+            "llm.stream": stream,
+            "llm.messages": len(request["messages"]),
+            "llm.max_tokens": request["max_tokens"],
+            "llm.estimated_tokens": estimated,
+        }
+    # Define a method to send a message to the model
+    def run(self, user_prompt):
+        request = self._request(user_prompt)
+        estimated = self._estimate(request)
+        with tracing.span("llm.call", self._span_attributes(request, estimated, stream=False), kind="client") as llm_span:
+            llm_span.set_attribute("ratelimit.wait_seconds", self.limiter.acquire(estimated))
+            timing = start_timing()
+            try:
+                response = self.client.chat.completions.create(**request)
+            except Exception:
+                telemetry.record_error()
+                raise
+            finish_timing(timing, response.model, response.usage)
+            self._settle(estimated, response.usage)
+            llm_span.set_attribute("llm.model", response.model)
+            llm_span.set_attributes(tracing.usage_attributes(response.usage))
         output = response.choices[0].message.content
-       # output = ""
-       # for update in response: # Streaming response
-       #     if update.choices:
-       #         output += update.choices[0].delta.content or ""
         # Print or return the model used
         print("Model chosen by the router:", response.model)
         return output, response.model
+    # Stream the response, yielding text deltas as they arrive
+    def run_stream(self, user_prompt):
+        """
+        Generator over the streamed response text
+
+        self.routed_model is filled in from the first chunk that carries a model name
+        (the leading content filter chunk has an empty one). The generator's return
+        value is (output, routed_model), the same shape as run().
+
+        @param user_prompt: Prompt sent as the user message
+        @return: Yields text deltas
+        """
+        self.routed_model = None
+        output = ""
+        usage = None
+        request = self._request(user_prompt)
+        estimated = self._estimate(request)
+        # A generator can't hold the span current across yields, it's only current while the request is made
+        llm_span = tracing.start_span("llm.call", self._span_attributes(request, estimated, stream=True), kind="client")
+        try:
+            llm_span.set_attribute("ratelimit.wait_seconds", self.limiter.acquire(estimated))
+            timing = start_timing()
+            with tracing.use_span(llm_span):
+                response = self.client.chat.completions.create(
+                    stream=True, stream_options={"include_usage": True}, **request
+                )
+            # For streams time to first byte is the first chunk, not the response headers
+            timing["first_byte"] = None
+            for update in response:
+                mark_first_byte()
+                if update.model and self.routed_model is None:
+                    self.routed_model = update.model
+                    llm_span.add_event("first_chunk")
+                if update.usage:
+                    usage = update.usage
+                if update.choices:
+                    delta = update.choices[0].delta.content or ""
+                    if delta:
+                        output += delta
+                        yield delta
+            finish_timing(timing, self.routed_model, usage)
+            self._settle(estimated, usage)
+            llm_span.set_attribute("llm.model", self.routed_model)
+            llm_span.set_attributes(tracing.usage_attributes(usage))
+            return output, self.routed_model
+        except Exception as e:
+            llm_span.record_error(e)
+            raise
+        finally:
+            llm_span.end()
 # Initialize the ModelRouterAgent with the system message
     def close(self):
-        self.client.close()
+        # Only the last agent using the shared client tears down its pool
+        if self.client is not None and registry.release(self.client):
+            self.client.close()
+        self.client = None
+
+# Seconds to wait before retrying a 429, honouring retry-after with jittered exponential backoff
+def retry_delay(error, attempt, base=1.0, cap=60.0):
+    headers = error.response.headers if error.response is not None else {}
+    backoff = min(cap, base * 2 ** attempt)
+    if headers.get("retry-after-ms"):
+        wait = float(headers["retry-after-ms"]) / 1000
+    elif headers.get("retry-after"):
+        try:
+            wait = float(headers["retry-after"])
+        except ValueError:
+            wait = backoff
+    else:
+        wait = 0.0
+    return wait + random.uniform(0, backoff)
+
+# Async variant backed by AsyncAzureOpenAI for fanning out many prompts
+class AsyncModelRouterAgent(ModelRouterAgent):
+    def __init__(self, system_prompt, max_retries=6):
+        self.endpoint = endpoint
+        self.api_key = api_key
+        self.deployment_name = deployment_name
+        self.api_version = api_version
+        self.client = async_registry.acquire(self.endpoint, self.api_version, self.api_key)
+        self.limiter = limiter_for("azure", self.deployment_name)
+        self.system_prompt = system_prompt
+        self.routed_model = None
+        self.max_retries = max_retries
+    async def run(self, user_prompt, priority=INTERACTIVE):
+        request = self._request(user_prompt)
+        estimated = self._estimate(request)
+        attributes = dict(self._span_attributes(request, estimated, stream=False), **{"ratelimit.priority": priority})
+        with tracing.span("llm.call", attributes, kind="client") as llm_span:
+            waited = 0.0
+            for attempt in range(self.max_retries + 1):
+                # A 429 seen by any agent pauses the limiter, so every attempt waits its turn
+                waited += await self.limiter.acquire_async(estimated, priority)
+                llm_span.set_attributes({"llm.attempts": attempt + 1, "ratelimit.wait_seconds": waited})
+                timing = start_timing()
+                try:
+                    response = await self.client.chat.completions.create(**request)
+                except RateLimitError as e:
+                    telemetry.record_error()
+                    if attempt == self.max_retries:
+                        raise
+                    delay = retry_delay(e, attempt)
+                    llm_span.add_event("retry", {"retry.attempt": attempt + 1, "retry.delay_seconds": delay})
+                    await asyncio.sleep(delay)
+                    continue
+                except Exception:
+                    telemetry.record_error()
+                    raise
+                finish_timing(timing, response.model, response.usage)
+                self._settle(estimated, response.usage)
+                llm_span.set_attribute("llm.model", response.model)
+                llm_span.set_attributes(tracing.usage_attributes(response.usage))
+                return response.choices[0].message.content, response.model
+    async def run_stream(self, user_prompt):
+        self.routed_model = None
+        usage = None
+        request = self._request(user_prompt)
+        estimated = self._estimate(request)
+        llm_span = tracing.start_span("llm.call", self._span_attributes(request, estimated, stream=True), kind="client")
+        try:
+            llm_span.set_attribute("ratelimit.wait_seconds", await self.limiter.acquire_async(estimated))
+            timing = start_timing()
+            with tracing.use_span(llm_span):
+                response = await self.client.chat.completions.create(
+                    stream=True, stream_options={"include_usage": True}, **request
+                )
+            timing["first_byte"] = None
+            async for update in response:
+                mark_first_byte()
+                if update.model and self.routed_model is None:
+                    self.routed_model = update.model
+                    llm_span.add_event("first_chunk")
+                if update.usage:
+                    usage = update.usage
+                if update.choices:
+                    delta = update.choices[0].delta.content or ""
+                    if delta:
+                        yield delta
+            finish_timing(timing, self.routed_model, usage)
+            self._settle(estimated, usage)
+            llm_span.set_attribute("llm.model", self.routed_model)
+            llm_span.set_attributes(tracing.usage_attributes(usage))
+        except Exception as e:
+            llm_span.record_error(e)
+            raise
+        finally:
+            llm_span.end()
+    async def run_many(self, prompts, concurrency=8, return_exceptions=False):
+        """
+        Run many prompts with at most `concurrency` requests in flight
+
+        Prompts are pulled lazily through a bounded queue, so a large iterable is never
+        materialised as pending requests all at once. They run in the limiter's batch
+        lane, behind any interactive run() on the same deployment.
+
+        @param prompts: Iterable of user prompts
+        @param concurrency: Maximum concurrent requests
+        @param return_exceptions: Store failures in the result list instead of raising
+        @return: List of (output, routed_model) in input order
+        """
+        results = {}
+        queue = asyncio.Queue(maxsize=concurrency * 2)
+
+        async def worker():
+            while True:
+                item = await queue.get()
+                if item is None:
+                    return
+                index, prompt = item
+                try:
+                    results[index] = await self.run(prompt, priority=BATCH)
+                except Exception as e:
+                    if not return_exceptions:
+                        raise
+                    results[index] = e
+
+        # Tasks copy the context they're created in, so every call's span nests under the batch
+        batch_span = tracing.start_span("router.batch", {"batch.concurrency": concurrency})
+        with tracing.use_span(batch_span):
+            workers = [asyncio.create_task(worker()) for _ in range(concurrency)]
+
+        async def feed():
+            for item in enumerate(prompts):
+                await queue.put(item)
+            for _ in workers:
+                await queue.put(None)
+
+        # Awaiting the feeder too surfaces an error raised by the prompts iterable instead of leaving the workers waiting
+        feeder = asyncio.create_task(feed())
+        try:
+            await asyncio.gather(feeder, *workers)
+        finally:
+            feeder.cancel()
+            for task in workers:
+                task.cancel()
+            batch_span.end()
+        return [results[index] for index in range(len(results))]
+    async def close(self):
+        if self.client is not None and async_registry.release(self.client):
+            await self.client.close()
+        self.client = None
 
 if __name__ == "__main__":
     agent1 = ModelRouterAgent("You are a senior engineer focused on cloud security posture management (CSPM). You've received a response from a Kubernetes cluster that the privileges of a ServiceAccount is permissive with automountServiceAccountToken active on a production pod application. Please summarize the main security risks in this CSPM report.")
@@ -57,15 +290,36 @@ if __name__ == "__main__":
 
     prompt = "Summarize the main security risks in this CSPM report."
 
-    print("Agent 1 response:")
-    agent1_response,agent1_model = agent1.run(prompt)
-    print(agent1_response)
-    print("Model chosen by the router:", agent1_model)
+    # Both agents' calls land in one trace
+    with tracing.span("router.pipeline"):
+        if os.environ.get("STREAM_RESPONSES", "").lower() in ("1", "true", "yes"):
+            # Render each agent's output as it streams in
+            print("Agent 1 response:")
+            agent1_response = ""
+            for delta in agent1.run_stream(prompt):
+                print(delta, end="", flush=True)
+                agent1_response += delta
+            print("\nModel chosen by the router:", agent1.routed_model)
 
-    print("\nAgent 2 response: (using Agent 1's output):")
-    agent2_response, agent2_model = agent2.run(agent1_response)
-    print(agent2_response)
-    print("Model chosen by the router:", agent2_model)
+            print("\nAgent 2 response: (using Agent 1's output):")
+            for delta in agent2.run_stream(agent1_response):
+                print(delta, end="", flush=True)
+            print("\nModel chosen by the router:", agent2.routed_model)
+        else:
+            print("Agent 1 response:")
+            agent1_response,agent1_model = agent1.run(prompt)
+            print(agent1_response)
+            print("Model chosen by the router:", agent1_model)
+
+            print("\nAgent 2 response: (using Agent 1's output):")
+            agent2_response, agent2_model = agent2.run(agent1_response)
+            print(agent2_response)
+            print("Model chosen by the router:", agent2_model)
 
     agent1.close()
     agent2.close()
+
+    # Dump per model counters and latency histograms (.prom for Prometheus text, JSON otherwise)
+    metrics_path = os.environ.get("ROUTER_METRICS_PATH")
+    if metrics_path:
+        telemetry.dump(metrics_path)
@@ -0,0 +1,212 @@
+import json
+import math
+import threading
+import time
+from contextvars import ContextVar
+
+
+# Latency buckets in seconds, Prometheus style (each bucket counts observations <= its bound)
+LATENCY_BUCKETS = (0.1, 0.25, 0.5, 1.0, 2.5, 5.0, 10.0, 20.0, 30.0, 60.0, 120.0, math.inf)
+
+# Timing of the request currently in flight in this thread / task
+_request_timing = ContextVar("request_timing", default=None)
+
+
+class Histogram:
+    def __init__(self, buckets=LATENCY_BUCKETS):
+        self.buckets = buckets
+        self.counts = [0] * len(buckets)
+        self.sum = 0.0
+        self.count = 0
+
+    def observe(self, value):
+        self.sum += value
+        self.count += 1
+        for i, bound in enumerate(self.buckets):
+            if value <= bound:
+                self.counts[i] += 1
+                break
+
+    def quantile(self, q):
+        """
+        Estimate a quantile as the upper bound of the bucket that contains it
+
+        @param q: Quantile between 0 and 1
+        @return: Bucket bound in seconds, or None when nothing was observed
+        """
+        if not self.count:
+            return None
+        rank = q * self.count
+        seen = 0
+        for bound, count in zip(self.buckets, self.counts):
+            seen += count
+            if seen >= rank:
+                return bound
+        return self.buckets[-1]
+
+    def to_dict(self):
+        return {
+            "count": self.count,
+            "sum": self.sum,
+            "p50": self.quantile(0.5),
+            "p95": self.quantile(0.95),
+            "p99": self.quantile(0.99),
+            "buckets": {_bound_label(b): c for b, c in zip(self.buckets, self.counts)},
+        }
+
+
+def _bound_label(bound):
+    return "+Inf" if bound == math.inf else repr(bound)
+
+
+# Per routed model counters and latency histograms
+class RouterTelemetry:
+    def __init__(self):
+        self.lock = threading.Lock()
+        self.models = {}
+
+    def _model(self, model):
+        stats = self.models.get(model)
+        if stats is None:
+            stats = {
+                "requests": 0,
+                "errors": 0,
+                "prompt_tokens": 0,
+                "completion_tokens": 0,
+                "latency": Histogram(),
+                "ttfb": Histogram(),
+            }
+            self.models[model] = stats
+        return stats
+
+    def record(self, model, prompt_tokens=0, completion_tokens=0, ttfb=None, latency=None):
+        """
+        Record one completed call
+
+        @param model: Model chosen by the router
+        @param prompt_tokens: Prompt tokens reported in usage
+        @param completion_tokens: Completion tokens reported in usage
+        @param ttfb: Seconds until the first byte / chunk arrived
+        @param latency: Total seconds for the call
+        """
+        with self.lock:
+            stats = self._model(model or "unknown")
+            stats["requests"] += 1
+            stats["prompt_tokens"] += prompt_tokens or 0
+            stats["completion_tokens"] += completion_tokens or 0
+            if ttfb is not None:
+                stats["ttfb"].observe(ttfb)
+            if latency is not None:
+                stats["latency"].observe(latency)
+
+    def record_error(self, model=None):
+        with self.lock:
+            self._model(model or "unknown")["errors"] += 1
+
+    def to_dict(self):
+        with self.lock:
+            return {
+                model: {
+                    "requests": stats["requests"],
+                    "errors": stats["errors"],
+                    "prompt_tokens": stats["prompt_tokens"],
+                    "completion_tokens": stats["completion_tokens"],
+                    "latency_seconds": stats["latency"].to_dict(),
+                    "ttfb_seconds": stats["ttfb"].to_dict(),
+                }
+                for model, stats in self.models.items()
+            }
+
+    def to_json(self, indent=2):
+        return json.dumps(self.to_dict(), indent=indent)
+
+    def to_prometheus(self):
+        with self.lock:
+            lines = []
+            counters = (
+                ("router_requests_total", "requests", "Calls answered per routed model"),
+                ("router_errors_total", "errors", "Failed calls per routed model"),
+                ("router_prompt_tokens_total", "prompt_tokens", "Prompt tokens per routed model"),
+                ("router_completion_tokens_total", "completion_tokens", "Completion tokens per routed model"),
+            )
+            for name, field, help_text in counters:
+                lines.append(f"# HELP {name} {help_text}")
+                lines.append(f"# TYPE {name} counter")
+                for model, stats in self.models.items():
+                    lines.append(f'{name}{{model="{model}"}} {stats[field]}')
+            histograms = (
+                ("router_latency_seconds", "latency", "Total call latency per routed model"),
+                ("router_ttfb_seconds", "ttfb", "Time to first byte per routed model"),
+            )
+            for name, field, help_text in histograms:
+                lines.append(f"# HELP {name} {help_text}")
+                lines.append(f"# TYPE {name} histogram")
+                for model, stats in self.models.items():
+                    histogram = stats[field]
+                    cumulative = 0
+                    for bound, count in zip(histogram.buckets, histogram.counts):
+                        cumulative += count
+                        lines.append(f'{name}_bucket{{model="{model}",le="{_bound_label(bound)}"}} {cumulative}')
+                    lines.append(f'{name}_sum{{model="{model}"}} {histogram.sum}')
+                    lines.append(f'{name}_count{{model="{model}"}} {histogram.count}')
+            return "\n".join(lines) + "\n"
+
+    def dump(self, path):
+        """
+        Write the metrics to a file, Prometheus text for .prom / .txt and JSON otherwise
+
+        @param path: Output file path
+        """
+        with open(path, "w") as file:
+            if path.endswith((".prom", ".txt")):
+                file.write(self.to_prometheus())
+            else:
+                file.write(self.to_json())
+
+
+telemetry = RouterTelemetry()
+
+
+def start_timing():
+    """
+    Start timing a call in the current thread / task
+
+    @return: Dict holding the start time, first_byte is filled in by the httpx response hook
+    """
+    timing = {"start": time.perf_counter(), "first_byte": None}
+    _request_timing.set(timing)
+    return timing
+
+
+def mark_first_byte():
+    timing = _request_timing.get()
+    if timing is not None and timing["first_byte"] is None:
+        timing["first_byte"] = time.perf_counter()
+
+
+# httpx event hooks, called as soon as response headers arrive and before the body is read
+def on_response(response):
+    mark_first_byte()
+
+
+async def on_response_async(response):
+    mark_first_byte()
+
+
+def finish_timing(timing, model, usage):
+    """
+    Record a finished call against the routed model
+
+    @param timing: Dict returned by start_timing
+    @param model: Model chosen by the router
+    @param usage: Usage object from the response, may be None
+    """
+    now = time.perf_counter()
+    first_byte = timing["first_byte"]
+    telemetry.record(
+        model,
+        prompt_tokens=getattr(usage, "prompt_tokens", 0),
+        completion_tokens=getattr(usage, "completion_tokens", 0),
+        ttfb=first_byte - timing["start"] if first_byte is not None else None,
+        latency=now - timing["start"],
+    )
@@ -0,0 +1,290 @@
+# Shared module, copied into other projects. Edit groq-chat/tracing.py and run: python tools/sync_shared.py
+import json
+import os
+import secrets
+import threading
+import time
+from contextlib import contextmanager
+from contextvars import ContextVar
+from typing import Optional
+
+# Finished traces are appended to this file, tracing is off when it's empty
+TRACE_PATH = os.environ.get("TRACE_PATH", "")
+# "otlp" writes one OTLP/JSON ExportTraceServiceRequest per trace per line (the OpenTelemetry
+# file exporter format, a collector's otlpjsonfile receiver reads it), "json" writes one flat span per line
+TRACE_FORMAT = os.environ.get("TRACE_FORMAT", "otlp")
+SERVICE_NAME = os.environ.get("TRACE_SERVICE_NAME", "")
+
+SPAN_KINDS = {"internal": 1, "server": 2, "client": 3}
+
+# Span the code running in this thread / task is part of
+_current_span = ContextVar("current_span", default=None)
+_write_lock = threading.Lock()
+
+
+def configure(service_name: Optional[str] = None, path: Optional[str] = None, format: Optional[str] = None):
+    """
+    Set the service name and sink, environment variables win over the app's defaults
+
+    @param service_name: service.name resource attribute, used when TRACE_SERVICE_NAME isn't set
+    @param path: Trace file, used when TRACE_PATH isn't set
+    @param format: otlp or json, used when TRACE_FORMAT isn't set
+    """
+    global SERVICE_NAME, TRACE_PATH, TRACE_FORMAT
+    SERVICE_NAME = os.environ.get("TRACE_SERVICE_NAME") or service_name or SERVICE_NAME
+    TRACE_PATH = os.environ.get("TRACE_PATH") or path or TRACE_PATH
+    TRACE_FORMAT = os.environ.get("TRACE_FORMAT") or format or TRACE_FORMAT
+
+
+def enabled() -> bool:
+    return bool(TRACE_PATH)
+
+
+class Span:
+    def __init__(self, name: str, parent: Optional["Span"] = None, attributes: Optional[dict] = None, kind: str = "internal"):
+        self.name = name
+        self.kind = kind
+        self.parent = parent
+        self.trace_id = parent.trace_id if parent else secrets.token_hex(16)
+        self.span_id = secrets.token_hex(8)
+        self.root = parent.root if parent else self
+        self.start_ns = time.time_ns()
+        self.end_ns = None
+        self.attributes = dict(attributes or {})
+        self.events = []
+        self.error = None
+        # Spans of the trace that ended before the root, written together when the root ends
+        self.finished = []
+
+    def set_attribute(self, key: str, value):
+        if value is not None:
+            self.attributes[key] = value
+
+    def set_attributes(self, attributes: dict):
+        for key, value in attributes.items():
+            self.set_attribute(key, value)
+
+    def add_event(self, name: str, attributes: Optional[dict] = None):
+        self.events.append((time.time_ns(), name, dict(attributes or {})))
+
+    def record_error(self, error: BaseException):
+        self.error = f"{type(error).__name__}: {error}"
+        self.add_event("exception", {"exception.type": type(error).__name__, "exception.message": str(error)})
+
+    def end(self):
+        if self.end_ns is not None:
+            return
+        self.end_ns = time.time_ns()
+        if self.root is self:
+            export(self.finished + [self])
+            self.finished = []
+        elif self.root.end_ns is None:
+            self.root.finished.append(self)
+        else:
+            # Outlived its root (e.g. a discarded background prefetch), write it on its own
+            export([self])
+
+    def to_dict(self) -> dict:
+        return {
+            "trace_id": self.trace_id,
+            "span_id": self.span_id,
+            "parent_span_id": self.parent.span_id if self.parent else None,
+            "name": self.name,
+            "kind": self.kind,
+            "start_time": self.start_ns / 1e9,
+            "duration_seconds": (self.end_ns - self.start_ns) / 1e9,
+            "attributes": self.attributes,
+            "events": [{"time": at / 1e9, "name": name, "attributes": attributes} for at, name, attributes in self.events],
+            "error": self.error,
+        }
+
+    def to_otlp(self) -> dict:
+        span = {
+            "traceId": self.trace_id,
+            "spanId": self.span_id,
+            "name": self.name,
+            "kind": SPAN_KINDS.get(self.kind, 1),
+            "startTimeUnixNano": str(self.start_ns),
+            "endTimeUnixNano": str(self.end_ns),
+            "attributes": otlp_attributes(self.attributes),
+            "events": [
+                {"timeUnixNano": str(at), "name": name, "attributes": otlp_attributes(attributes)}
+                for at, name, attributes in self.events
+            ],
+            "status": {"code": 2, "message": self.error} if self.error else {"code": 0},
+        }
+        if self.parent:
+            span["parentSpanId"] = self.parent.span_id
+        return span
+
+
+class NoopSpan:
+    # Handed out while tracing is off so instrumented code doesn't need to check
+    def set_attribute(self, key, value):
+        pass
+
+    def set_attributes(self, attributes):
+        pass
+
+    def add_event(self, name, attributes=None):
+        pass
+
+    def record_error(self, error):
+        pass
+
+    def end(self):
+        pass
+
+
+NOOP_SPAN = NoopSpan()
+
+
+def otlp_value(value) -> dict:
+    if isinstance(value, bool):
+        return {"boolValue": value}
+    if isinstance(value, int):
+        # int64 is a string in the protobuf JSON mapping
+        return {"intValue": str(value)}
+    if isinstance(value, float):
+        return {"doubleValue": value}
+    if isinstance(value, (list, tuple)):
+        return {"arrayValue": {"values": [otlp_value(item) for item in value]}}
+    return {"stringValue": str(value)}
+
+
+def otlp_attributes(attributes: dict) -> list:
+    return [{"key": key, "value": otlp_value(value)} for key, value in attributes.items()]
+
+
+def export(spans: list):
+    """
+    Append finished spans to TRACE_PATH
+
+    @param spans: Spans of one trace
+    """
+    if TRACE_FORMAT == "json":
+        lines = [json.dumps(span.to_dict(), default=str) for span in spans]
+    else:
+        request = {
+            "resourceSpans": [{
+                "resource": {"attributes": otlp_attributes({"service.name": SERVICE_NAME or "unknown_service"})},
+                "scopeSpans": [{"scope": {"name": "tracing"}, "spans": [span.to_otlp() for span in spans]}],
+            }]
+        }
+        lines = [json.dumps(request, default=str)]
+    with _write_lock:
+        with open(TRACE_PATH, "a", encoding="utf-8") as file:
+            file.write("\n".join(lines) + "\n")
+
+
+def current_span():
+    return _current_span.get()
+
+
+def start_span(name: str, attributes: Optional[dict] = None, kind: str = "internal", parent=None):
+    """
+    Start a span without making it current, for generators and work handed to other threads
+
+    @param name: Span name, e.g. llm.call
+    @param attributes: Initial attributes
+    @param kind: internal or client
+    @param parent: Parent span, the current span when not given
+    @return: Span (NoopSpan when tracing is off), call end() when done
+    """
+    if not TRACE_PATH:
+        return NOOP_SPAN
+    parent = parent if parent is not None else _current_span.get()
+    return Span(name, parent if isinstance(parent, Span) else None, attributes, kind)
+
+
+@contextmanager
+def use_span(span):
+    # Make an already started span current for the block without ending it
+    if isinstance(span, NoopSpan):
+        yield span
+        return
+    token = _current_span.set(span)
+    try:
+        yield span
+    finally:
+        _current_span.reset(token)
+
+
+@contextmanager
+def span(name: str, attributes: Optional[dict] = None, kind: str = "internal"):
+    """
+    Time the block as a child of the current span, exceptions are recorded and re-raised
+
+    Works around awaits too since the current span lives in a context variable.
+
+    @param name: Span name
+    @param attributes: Initial attributes
+    @param kind: internal or client
+    @return: The Span, for adding attributes and events
+    """
+    current = start_span(name, attributes, kind)
+    try:
+        with use_span(current):
+            yield current
+    except BaseException as e:
+        current.record_error(e)
+        raise
+    finally:
+        current.end()
+
+
+def propagate(function):
+    """
+    Bind the current span to a function run on another thread, thread pools don't copy context
+
+    @param function: Function submitted to an executor
+    @return: Wrapper that runs it with the caller's span as the current span
+    """
+    parent = _current_span.get()
+    if parent is None:
+        return function
+
+    def wrapper(*args, **kwargs):
+        token = _current_span.set(parent)
+        try:
+            return function(*args, **kwargs)
+        finally:
+            _current_span.reset(token)
+    return wrapper
+
+
+def on_http_response(response):
+    # httpx response hook: every HTTP attempt, SDK retries included, shows up on the current span
+    current = _current_span.get()
+    if current is None:
+        return
+    current.set_attribute("http.attempts", current.attributes.get("http.attempts", 0) + 1)
+    current.add_event("http.response", {
+        "http.status_code": response.status_code,
+        "url.path": response.request.url.path,
+        "http.response.header.content-length": int(response.headers.get("content-length") or 0),
+    })
+
+
+async def on_http_response_async(response):
+    on_http_response(response)
+
+
+def usage_attributes(usage) -> dict:
+    """
+    Span attributes for a completion's usage, Groq also reports its queue and prefill timings
+
+    @param usage: usage object of a completion or final stream chunk, may be None
+    @return: Attribute dict, values the provider didn't send are left out
+    """
+    if usage is None:
+        return {}
+    attributes = {
+        "llm.usage.prompt_tokens": getattr(usage, "prompt_tokens", None),
+        "llm.usage.completion_tokens": getattr(usage, "completion_tokens", None),
+        "llm.usage.total_tokens": getattr(usage, "total_tokens", None),
+        "llm.queue_seconds": getattr(usage, "queue_time", None),
+        "llm.prompt_seconds": getattr(usage, "prompt_time", None),
+        "llm.completion_seconds": getattr(usage, "completion_time", None),
+    }
+    return {key: value for key, value in attributes.items() if value is not None}
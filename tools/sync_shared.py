@@ -0,0 +1,59 @@
+import argparse
+import os
+import shutil
+import sys
+
+ROOT = os.path.dirname(os.path.dirname(os.path.abspath(__file__)))
+
+# Each project is deployed on its own (groq-chat builds its image from its own folder), so the shared modules are
+# copied into every folder that uses them. The first folder holds the copy to edit, the rest are synced from it.
+SHARED = {
+    "rate_limiter.py": ["groq-chat", "groq-exa", "modelrouter", "llm-examples/semantic_kernel"],
+    "tracing.py": ["groq-chat", "groq-exa", "modelrouter", "llm-examples/semantic_kernel"],
+    "search_cache.py": ["groq-chat", "groq-exa", "langgraph"],
+    "compaction.py": ["groq-chat", "groq-exa"],
+    "completion_cache.py": ["groq-chat", "groq-exa"],
+}
+
+
+def read(path: str) -> bytes:
+    with open(path, "rb") as f:
+        return f.read()
+
+
+def stale_copies() -> list:
+    """
+    Compare every copy of the shared modules against the one in the first folder
+
+    @return: List of (source, copy) paths whose contents differ
+    """
+    stale = []
+    for name, folders in SHARED.items():
+        source = os.path.join(ROOT, folders[0], name)
+        for folder in folders[1:]:
+            copy = os.path.join(ROOT, folder, name)
+            if not os.path.exists(copy) or read(copy) != read(source):
+                stale.append((source, copy))
+    return stale
+
+
+def main():
+    parser = argparse.ArgumentParser(description="Copy the shared modules into every project that vendors them")
+    parser.add_argument("--check", action="store_true", help="Only report copies that differ, exit 1 if any do")
+    args = parser.parse_args()
+
+    stale = stale_copies()
+    for source, copy in stale:
+        source, copy = os.path.relpath(source, ROOT), os.path.relpath(copy, ROOT)
+        if args.check:
+            print(f"{copy} differs from {source}")
+        else:
+            shutil.copyfile(os.path.join(ROOT, source), os.path.join(ROOT, copy))
+            print(f"{source} -> {copy}")
+    if args.check and stale:
+        print("Edit the first copy and run: python tools/sync_shared.py")
+        sys.exit(1)
+
+
+if __name__ == "__main__":
+    main()
@@ -0,0 +1,5 @@
+from sync_shared import stale_copies
+
+
+def test_vendored_copies_are_identical():
+    assert stale_copies() == [], "run python tools/sync_shared.py after editing a shared module"